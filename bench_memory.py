@@ -0,0 +1,91 @@
+"""
+Reminder memory benchmark (tracemalloc): bytes per scheduled dose.
+
+  - closure+schedule: purana tareeqa — har dose ke liye `job` closure,
+    `schedule.Job` aur uske andar `functools.partial`
+  - heap / wheel: `Reminder` (__slots__) backend mein
+  - scheduler: `Reminder` + ReminderScheduler ke phone/medicine indexes aur
+    string table (har phone / medicine / time ki ek copy)
+
+Usage:
+    python bench_memory.py                  # 100k doses
+    python bench_memory.py --doses 1000000 --patients 200000
+"""
+import argparse, gc, os, random, tempfile, time, tracemalloc
+
+# main.py import karne ke liye dummy config (koi network call nahi hoti)
+os.environ.setdefault("API_KEY", "bench")
+os.environ.setdefault("Api_Url", "http://127.0.0.1:9/")
+os.environ.setdefault("Token", "bench")
+# Throwaway store: ./reminders.db ko haath nahi lagta
+os.environ.setdefault("REMINDER_DB", os.path.join(tempfile.mkdtemp(prefix="bench-"), "reminders.db"))
+
+import schedule
+from main import Reminder, ReminderScheduler, SCHEDULER_BACKENDS, next_fire_at
+
+MEDICINES = ["Panadol", "Brufen", "Augmentin", "Metformin", "Lipitor", "Glucophage", "Disprin", "Amoxil"]
+
+
+def doses(n: int, patients: int, seed: int = 7) -> list[tuple[str, str, str]]:
+    """(phone, medicine, time) tuples with fresh (non-shared) string objects, like parsed JSON."""
+    rnd = random.Random(seed)
+    return [(f"+92300{rnd.randrange(patients):07d}",
+             rnd.choice(MEDICINES).encode().decode(),
+             f"{rnd.randrange(24):02d}:{rnd.choice((0, 15, 30, 45)):02d}:00") for _ in range(n)]
+
+
+def old_closures(items):
+    sched = schedule.Scheduler()
+    for phone, medicine, t in items:
+        def job(phone=phone, medicine=medicine, t=None):
+            pass
+        sched.every().day.at(t).do(job, t=t)
+    return sched
+
+
+def compact(backend_name: str):
+    def build(items):
+        now = time.time()
+        backend = SCHEDULER_BACKENDS[backend_name]()
+        for phone, medicine, t in items:
+            backend.push(Reminder(phone=phone, medicine=medicine, t=t, t_24=t, next_fire_at=next_fire_at(t, now)))
+        return backend
+    return build
+
+
+def indexed(items):
+    now = time.time()
+    sched = ReminderScheduler()
+    for phone, medicine, t in items:
+        sched.add(Reminder(phone=phone, medicine=medicine, t=t, t_24=t, next_fire_at=next_fire_at(t, now)))
+    return sched
+
+
+def measure(build, items) -> int:
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    keep = build(items)
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    del keep
+    return used
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--doses", type=int, default=100_000)
+    parser.add_argument("--patients", type=int, default=25_000)
+    args = parser.parse_args()
+
+    items = doses(args.doses, args.patients)
+    print(f"{'layout':<18}{'doses':>10}{'total (MB)':>12}{'bytes/dose':>12}")
+    for name, build in [("closure+schedule", old_closures), ("heap", compact("heap")),
+                        ("wheel", compact("wheel")), ("scheduler", indexed)]:
+        used = measure(build, items)
+        print(f"{name:<18}{args.doses:>10}{used / 1e6:>12.1f}{used / args.doses:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
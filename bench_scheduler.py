@@ -0,0 +1,195 @@
+"""
+Scheduler benchmark suite: `schedule.every().day.at()` vs heap vs timing wheel.
+
+Har size N ke liye teen cheezen napta hai:
+  - insert: N daily dose times daalne ka waqt (sab agle 1–24 ghante mein)
+  - idle tick: jab kuch due na ho, ek tick ka CPU time
+      schedule → ek `run_pending()` (har tick pe saari jobs scan hoti hain)
+      heap / wheel → simulated clock ko 1 second aage barhana
+  - fire: K reminders ek hi second mein due hon to unhein nikalne (aur agle
+    din ke liye dobara rakhne) ki raftaar, reminders/second
+
+Layers:
+  - backend: sirf `HeapBackend` / `TimingWheelBackend` (push / pop_due)
+  - scheduler: `ReminderScheduler` (store ke baghair) — indexes, batching aur
+    reschedule samait, wahi raasta jo `schedule_reminder` / `run_schedule` leta hai
+
+Usage:
+    python bench_scheduler.py                                  # 1k … 5M, table
+    python bench_scheduler.py --sizes 1000 100000 --backends heap wheel --layers scheduler
+    python bench_scheduler.py --fire 50000 --json results.json # machine-readable (`-` = stdout)
+"""
+import argparse, gc, json, os, platform, random, sys, tempfile, time
+from datetime import datetime
+
+# main.py import karne ke liye dummy config (koi network call nahi hoti)
+os.environ.setdefault("API_KEY", "bench")
+os.environ.setdefault("Api_Url", "http://127.0.0.1:9/")
+os.environ.setdefault("Token", "bench")
+# Throwaway store: ./reminders.db ko haath nahi lagta
+os.environ.setdefault("REMINDER_DB", os.path.join(tempfile.mkdtemp(prefix="bench-"), "reminders.db"))
+
+import schedule
+from main import Reminder, ReminderScheduler, SCHEDULER_BACKENDS
+
+IDLE_TICKS = 1000
+SCHEDULE_IDLE_TICKS = 3
+
+
+def backdrop(n: int, now: float, seed: int = 42) -> list[tuple[str, str, float]]:
+    """N (phone, time, fire_at) doses due 1–24 hours from `now`, so none fire during the idle ticks."""
+    rnd = random.Random(seed)
+    doses = []
+    for i in range(n):
+        fire_at = now + rnd.randrange(3600, 86400)
+        doses.append((f"+92300{i:07d}", time.strftime("%H:%M:%S", time.localtime(fire_at)), fire_at))
+    return doses
+
+
+def burst(k: int, fire_at: float) -> list[tuple[str, str, float]]:
+    t = time.strftime("%H:%M:%S", time.localtime(fire_at))
+    return [(f"+92311{i:07d}", t, fire_at) for i in range(k)]
+
+
+def bench_schedule(doses, due, now: float) -> dict:
+    sched = schedule.Scheduler()
+    job = lambda t=None: None
+
+    start = time.perf_counter()
+    for _, t, _ in doses:
+        sched.every().day.at(t).do(job, t=t)
+    insert = time.perf_counter() - start
+
+    start = time.process_time()
+    for _ in range(SCHEDULE_IDLE_TICKS):
+        sched.run_pending()
+    idle_tick = (time.process_time() - start) / SCHEDULE_IDLE_TICKS
+
+    # K jobs ko abhi due kar do (schedule ko simulated clock nahi milti)
+    burst_jobs = [sched.every().day.at(t).do(job, t=t) for _, t, _ in due]
+    due_now = datetime.now()
+    for burst_job in burst_jobs:
+        burst_job.next_run = due_now
+    start = time.perf_counter()
+    sched.run_pending()
+    fire = time.perf_counter() - start
+    return {"insert_s": insert, "idle_tick_cpu_s": idle_tick, "fire_s": fire, "fired": len(burst_jobs)}
+
+
+def make_backend(name: str, now: float):
+    return SCHEDULER_BACKENDS[name]() if name == "heap" else SCHEDULER_BACKENDS[name](now)
+
+
+def bench_backend(name: str, doses, due, now: float) -> dict:
+    backend = make_backend(name, now)
+    reminders = [Reminder(phone=phone, medicine="Panadol", t=t, t_24=t, next_fire_at=fire_at)
+                 for phone, t, fire_at in doses]
+
+    start = time.perf_counter()
+    for reminder in reminders:
+        backend.push(reminder)
+    insert = time.perf_counter() - start
+
+    start = time.process_time()
+    for step in range(1, IDLE_TICKS + 1):
+        backend.pop_due(now + step)
+        backend.next_deadline()
+    idle_tick = (time.process_time() - start) / IDLE_TICKS
+
+    fire_at = due[0][2] if due else now + IDLE_TICKS + 1
+    for phone, t, at in due:
+        backend.push(Reminder(phone=phone, medicine="Panadol", t=t, t_24=t, next_fire_at=at))
+    start = time.perf_counter()
+    fired = len(backend.pop_due(fire_at))
+    fire = time.perf_counter() - start
+    return {"insert_s": insert, "idle_tick_cpu_s": idle_tick, "fire_s": fire, "fired": fired}
+
+
+def bench_scheduler(name: str, doses, due, now: float) -> dict:
+    sched = ReminderScheduler(backend=make_backend(name, now))
+    reminders = [Reminder(phone=phone, medicine="Panadol", t=t, t_24=t, next_fire_at=fire_at)
+                 for phone, t, fire_at in doses]
+
+    start = time.perf_counter()
+    for reminder in reminders:
+        sched.add(reminder)
+    insert = time.perf_counter() - start
+
+    fired = []
+    collect = lambda batches: fired.extend(reminder for batch in batches for reminder in batch)
+    start = time.process_time()
+    for step in range(1, IDLE_TICKS + 1):
+        sched._fire_due(now + step, collect, sched._generation)
+        sched.backend.next_deadline()
+    idle_tick = (time.process_time() - start) / IDLE_TICKS
+
+    fire_at = due[0][2] if due else now + IDLE_TICKS + 1
+    for phone, t, at in due:
+        sched.add(Reminder(phone=phone, medicine="Panadol", t=t, t_24=t, next_fire_at=at))
+    start = time.perf_counter()
+    sched._fire_due(fire_at, collect, sched._generation)
+    fire = time.perf_counter() - start
+    return {"insert_s": insert, "idle_tick_cpu_s": idle_tick, "fire_s": fire, "fired": len(fired)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000, 5_000_000])
+    parser.add_argument("--backends", nargs="+", default=["schedule", "heap", "wheel"],
+                        choices=["schedule", *SCHEDULER_BACKENDS])
+    parser.add_argument("--layers", nargs="+", default=["backend", "scheduler"], choices=["backend", "scheduler"],
+                        help="for heap / wheel: raw backend and/or ReminderScheduler on top of it")
+    parser.add_argument("--fire", type=int, default=10_000, help="K reminders due in the same second")
+    parser.add_argument("--json", metavar="PATH", help="write results as JSON (`-` for stdout, table goes to stderr)")
+    args = parser.parse_args()
+
+    table = sys.stderr if args.json == "-" else sys.stdout
+    print(f"{'backend':<10}{'layer':<11}{'jobs':>10}{'insert (s)':>12}{'per insert (us)':>17}"
+          f"{'idle tick cpu (us)':>20}{'fire K/s':>12}", file=table)
+    results = []
+    for n in args.sizes:
+        now = float(int(time.time()))
+        doses = backdrop(n, now)
+        due = burst(args.fire, now + IDLE_TICKS + 1)
+        for name in args.backends:
+            for layer in (["-"] if name == "schedule" else args.layers):
+                gc.collect()
+                if name == "schedule":
+                    result = bench_schedule(doses, due, now)
+                elif layer == "backend":
+                    result = bench_backend(name, doses, due, now)
+                else:
+                    result = bench_scheduler(name, doses, due, now)
+                fire_rate = result["fired"] / result["fire_s"] if result["fire_s"] else None
+                results.append({
+                    "backend": name,
+                    "layer": layer,
+                    "n": n,
+                    "insert_s": round(result["insert_s"], 4),
+                    "insert_us_per_job": round(result["insert_s"] / n * 1e6, 3),
+                    "idle_tick_cpu_us": round(result["idle_tick_cpu_s"] * 1e6, 3),
+                    "fire_k": result["fired"],
+                    "fire_s": round(result["fire_s"], 4),
+                    "fire_per_s": round(fire_rate) if fire_rate else None,
+                })
+                row = results[-1]
+                print(f"{name:<10}{layer:<11}{n:>10}{row['insert_s']:>12.2f}{row['insert_us_per_job']:>17.2f}"
+                      f"{row['idle_tick_cpu_us']:>20.1f}{row['fire_per_s'] or 0:>12}", file=table)
+
+    if args.json:
+        report = {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "idle_ticks": {"schedule": SCHEDULE_IDLE_TICKS, "heap/wheel": IDLE_TICKS},
+            "results": results,
+        }
+        if args.json == "-":
+            print(json.dumps(report, indent=2))
+        else:
+            with open(args.json, "w") as f:
+                json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
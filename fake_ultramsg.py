@@ -0,0 +1,125 @@
+"""
+Local UltraMsg stand-in: `POST /<instance>/messages/chat` bina network ke.
+
+Asli UltraMsg ki tarah form body (token, to, body, referenceId) leta hai aur
+`{"sent": "true", ...}` lautata hai, magar koi message kisi patient tak nahi
+jata. Latency distribution, error rate aur 429 (per-token rate limit) sab
+flags se set hote hain, taake dispatch throughput laptop pe test ho sake.
+
+Usage:
+    python fake_ultramsg.py                                   # :9911, 80ms lognormal
+    python fake_ultramsg.py --latency lognormal --latency-ms 120 --jitter 0.6 --error-rate 0.02
+    python fake_ultramsg.py --rate-limit 10 --burst 20        # token ke 10 msg/s se upar → 429
+
+App ko is pe point karo:
+    Api_Url=http://127.0.0.1:9911/instance1/ Token=fake uvicorn main:app
+
+Counters (status codes, latency, duplicate referenceIds): GET /stats
+"""
+import argparse, asyncio, math, random, time
+from collections import Counter
+from urllib.parse import parse_qs
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--host", default="127.0.0.1")
+parser.add_argument("--port", type=int, default=9911)
+parser.add_argument("--latency", default="lognormal", choices=["fixed", "uniform", "exponential", "lognormal"])
+parser.add_argument("--latency-ms", type=float, default=80.0, help="median (lognormal), mean (exponential) or value")
+parser.add_argument("--jitter", type=float, default=0.5,
+                    help="lognormal sigma, or ± fraction of --latency-ms for uniform")
+parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 500")
+parser.add_argument("--rate-limit", type=float, default=0.0, help="messages/second per token, 0 = unlimited")
+parser.add_argument("--burst", type=float, default=20.0, help="token bucket size for --rate-limit")
+args = parser.parse_args() if __name__ == "__main__" else parser.parse_args([])
+
+
+def sample_latency() -> float:
+    base = args.latency_ms / 1000
+    if args.latency == "fixed":
+        return base
+    if args.latency == "uniform":
+        return max(0.0, random.uniform(base * (1 - args.jitter), base * (1 + args.jitter)))
+    if args.latency == "exponential":
+        return random.expovariate(1 / base) if base else 0.0
+    return base * math.exp(random.gauss(0, args.jitter))
+
+
+class Bucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """0 if a token was taken, else seconds until the next one."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+app = FastAPI()
+buckets: dict[str, Bucket] = {}
+codes: Counter = Counter()
+references: set[str] = set()
+duplicates = 0
+latencies: list[float] = []
+started = time.monotonic()
+
+
+@app.post("/messages/chat")
+@app.post("/{instance}/messages/chat")
+async def chat(request: Request, instance: str = ""):
+    global duplicates
+    form = {k: v[0] for k, v in parse_qs((await request.body()).decode("utf8", "replace")).items()}
+    token = form.get("token", "")
+
+    if args.rate_limit:
+        bucket = buckets.get(token)
+        if bucket is None:
+            bucket = buckets[token] = Bucket(args.rate_limit, args.burst)
+        retry_after = bucket.take()
+        if retry_after:
+            codes[429] += 1
+            return JSONResponse(status_code=429, headers={"Retry-After": str(math.ceil(retry_after))},
+                                content={"error": "Too many requests"})
+
+    latency = sample_latency()
+    await asyncio.sleep(latency)
+    latencies.append(latency)
+    if random.random() < args.error_rate:
+        codes[500] += 1
+        return JSONResponse(status_code=500, content={"error": "Internal server error (fake)"})
+
+    reference = form.get("referenceId")
+    if reference:
+        duplicates += reference in references
+        references.add(reference)
+    codes[200] += 1
+    return {"sent": "true", "message": "ok", "id": codes[200], "instance": instance, "to": form.get("to")}
+
+
+@app.get("/stats")
+async def stats():
+    recent = sorted(latencies[-10_000:])
+    pick = lambda q: round(recent[min(len(recent) - 1, int(q * len(recent)))] * 1000, 2) if recent else None
+    elapsed = time.monotonic() - started
+    return {
+        "requests": sum(codes.values()),
+        "codes": dict(codes),
+        "sent_per_s": round(codes[200] / elapsed, 2),
+        "duplicate_references": duplicates,
+        "latency_ms": {"p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99)},
+    }
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,198 @@
+"""
+End-to-end load test: `POST /reminder` ko target RPS pe chalana.
+
+Open loop: har request apne tay-shuda waqt pe jati hai, chahe pichli abhi
+pending ho, aur latency usi waqt se napi jati hai (coordinated omission se
+bachne ke liye). Aakhir mein `/metrics` se stats le kar JSON print karta hai.
+
+`--spawn` fake UltraMsg (fake_ultramsg.py) aur app (mock LLM ke sath) khud
+chalata hai. Har request ek naye phone ke liye aisa dose time deti hai jo
+test ke dauran hi due ho, taake scheduler lag aur dispatch bhi load mein aayen.
+
+Bina `--spawn` ke load `--url` wali chalti hui app pe jata hai, jo asli
+WhatsApp bhejti hai, is liye `--live` dena zaroori hai. Us surat mein dose
+time 12 ghante aage rakha jata hai (run ke dauran kuch fire nahi hota) aur
+test ke `+92399…` phones ke reminders aakhir mein `DELETE /reminder?phone=`
+se hata diye jate hain.
+
+Usage:
+    python loadtest.py --spawn --rps 200 --duration 30
+    python loadtest.py --spawn --agent --mock-llm-ms 300 --rps 20    # agent path (REMINDER_FAST_PATH=0)
+    python loadtest.py --live --url http://127.0.0.1:8000 --rps 50 > result.json
+
+`--spawn` ke sath app ka baqi config environment se aata hai, e.g.
+`ULTRAMSG_RATE=1000 DISPATCH_WORKERS=32 python loadtest.py --spawn`.
+"""
+import argparse, asyncio, json, os, subprocess, sys, tempfile, time
+from datetime import datetime, timedelta
+
+import httpx
+
+
+def percentile(sorted_values: list[float], q: float) -> float | None:
+    if not sorted_values:
+        return None
+    return round(sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))] * 1000, 2)
+
+
+async def wait_until_up(client: httpx.AsyncClient, url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if (await client.get(url)).status_code < 500:
+                return
+        except httpx.TransportError:
+            pass
+        if time.monotonic() > deadline:
+            raise SystemExit(f"❌ {url} did not come up in {timeout:.0f}s")
+        await asyncio.sleep(0.2)
+
+
+async def run(args) -> dict:
+    latencies: list[float] = []
+    codes: dict[str, int] = {}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    cleaned = None
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout) as client:
+        await wait_until_up(client, "/metrics")
+        if args.spawn:
+            # Dose time: load khatam hone ke foran baad, sab reminders ek saath due (scheduler lag bhi napna hai)
+            fire_at = datetime.now() + timedelta(seconds=args.duration + 2)
+        else:
+            # Live app: dose run aur cleanup ke baad hi aata, koi asli message nahi jata
+            fire_at = datetime.now() + timedelta(hours=12)
+        dose_time = fire_at.strftime("%H:%M:%S")
+
+        async def one(i: int, scheduled: float):
+            body = {"medicine_name": "Panadol", "dose_times": [dose_time], "phone": test_phone(i)}
+            try:
+                res = await client.post("/reminder", json=body)
+                key = str(res.status_code)
+            except httpx.HTTPError as e:
+                key = type(e).__name__
+            latencies.append(time.perf_counter() - scheduled)
+            codes[key] = codes.get(key, 0) + 1
+
+        tasks = []
+        start = time.perf_counter()
+        total = int(args.rps * args.duration)
+        for i in range(total):
+            scheduled = start + i / args.rps
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(one(i, scheduled)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+        if args.spawn:
+            # Reminders fire hone aur bhejne ka intezar, phir scheduler lag
+            await asyncio.sleep(max(0.0, (fire_at - datetime.now()).total_seconds()) + args.drain)
+        metrics = (await client.get("/metrics")).json()
+        if not args.spawn:
+            cleaned = await cleanup(client, total, args.concurrency)
+
+    latencies.sort()
+    ok = codes.get("200", 0)
+    scheduler = metrics.get("scheduler", {})
+    return {
+        "target_rps": args.rps,
+        "duration_s": round(elapsed, 2),
+        "requests": total,
+        "throughput_rps": round(ok / elapsed, 2),
+        "error_rate": round(1 - ok / total, 4) if total else 0.0,
+        "codes": codes,
+        "latency_ms": {"p50": percentile(latencies, 0.5), "p95": percentile(latencies, 0.95),
+                       "p99": percentile(latencies, 0.99), "max": percentile(latencies, 1.0)},
+        "scheduler": {"fired": scheduler.get("fired"), "messages": scheduler.get("messages"),
+                      "lag_ms": scheduler.get("lag")},
+        "dispatch": metrics.get("dispatch"),
+        "outbox": metrics.get("outbox"),
+        "cleaned_up": cleaned,
+    }
+
+
+def test_phone(i: int) -> str:
+    return f"+92399{i:07d}"
+
+
+async def cleanup(client: httpx.AsyncClient, total: int, concurrency: int) -> int:
+    """Delete the daily reminders this run left behind; return how many phones were cleared."""
+    limit = asyncio.Semaphore(concurrency)
+    cleared = 0
+
+    async def one(i: int):
+        nonlocal cleared
+        async with limit:
+            try:
+                res = await client.delete("/reminder", params={"phone": test_phone(i)})
+            except httpx.HTTPError:
+                return
+            cleared += res.status_code == 200
+
+    await asyncio.gather(*(one(i) for i in range(total)))
+    if cleared < total:
+        print(f"⚠️ Cleaned up {cleared}/{total} test phones", file=sys.stderr)
+    return cleared
+
+
+def spawn(args) -> list[subprocess.Popen]:
+    """Start fake UltraMsg plus the app (mock LLM, throwaway DB) and point `--url` at it."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    fake_port, app_port = args.port + 1, args.port
+    db = os.path.join(tempfile.mkdtemp(prefix="loadtest-"), "reminders.db")
+    env = {
+        **os.environ,
+        "Api_Url": f"http://127.0.0.1:{fake_port}/instance1/",
+        "Token": "loadtest",
+        "LLM_PROVIDER": "mock",
+        "MOCK_LLM_LATENCY_MS": str(args.mock_llm_ms),
+        "REMINDER_FAST_PATH": "0" if args.agent else "1",
+        "REMINDER_DB": db,
+    }
+    quiet = subprocess.DEVNULL
+    procs = [
+        subprocess.Popen([sys.executable, os.path.join(here, "fake_ultramsg.py"), "--port", str(fake_port),
+                          "--latency-ms", str(args.ultramsg_ms)], stdout=quiet, stderr=quiet),
+        subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(app_port),
+                          "--workers", str(args.workers), "--log-level", "warning"],
+                         cwd=here, env=env, stdout=quiet, stderr=quiet),
+    ]
+    args.url = f"http://127.0.0.1:{app_port}"
+    return procs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--rps", type=float, default=100.0)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of load")
+    parser.add_argument("--concurrency", type=int, default=500, help="max open connections")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--drain", type=float, default=5.0, help="seconds to wait for sends after reminders fire")
+    parser.add_argument("--spawn", action="store_true", help="start fake UltraMsg and the app (mock LLM)")
+    parser.add_argument("--port", type=int, default=8765, help="app port with --spawn (fake UltraMsg uses +1)")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers with --spawn")
+    parser.add_argument("--agent", action="store_true", help="go through the agent (REMINDER_FAST_PATH=0)")
+    parser.add_argument("--live", action="store_true",
+                        help="allow a run without --spawn against the real app at --url "
+                             "(doses are set 12h ahead and deleted afterwards)")
+    parser.add_argument("--mock-llm-ms", type=float, default=0.0)
+    parser.add_argument("--ultramsg-ms", type=float, default=80.0)
+    args = parser.parse_args()
+    if not args.spawn and not args.live:
+        parser.error("without --spawn the load goes to a real app that sends real WhatsApp messages; "
+                     "pass --live to run it anyway")
+
+    procs = spawn(args) if args.spawn else []
+    try:
+        result = asyncio.run(run(args))
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.wait()
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
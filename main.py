@@ -1,18 +1,36 @@
 from pydantic import BaseModel  # Data validation aur schema banane ke liye (e.g. user input).
 from dotenv import load_dotenv  # .env file se secrets (API key, tokens) load karta hai.
-import os, requests, schedule, time, threading, asyncio
+import os, socket, requests, httpx, time, threading, multiprocessing, asyncio, heapq, itertools, math, sqlite3, queue, uuid, zlib, random, json, re
 # os → Environment variables access karne ke liye.
 # requests → WhatsApp API ko HTTP requests bhejne ke liye.
-# schedule → Jobs schedule karne ke liye (jaise reminder time set karna).
+# httpx → Async mode mein WhatsApp API ko non-blocking requests ke liye.
 # time → Sleep aur delay ke liye.
 # threading → Background thread mein scheduler chalane ke liye.
+# multiprocessing → Sharded mode mein har shard alag process.
 # asyncio → Async functions run karne ke liye.
+# heapq, itertools, math → Scheduler engine (min-heap / timing wheel) ke liye.
+# sqlite3 → Reminders ko disk pe save karne ke liye (restart ke baad bhi rahen).
+# queue → Scheduler aur dispatch workers ke beech bounded queue.
+# uuid, socket → Background request IDs aur leader lease ke owner ID ke liye.
+# zlib → Phone number ka stable hash (shard routing).
+# random → Retry backoff mein jitter.
+# json → Outbox row mein ek message ki saari medicines.
+# re → Mock LLM user text se phone / medicine / times nikalta hai.
 from agents import Agent, OpenAIChatCompletionsModel, AsyncOpenAI, Runner, function_tool, enable_verbose_stdout_logging
+from agents import Model, ModelResponse, Usage
 from agents.run import RunConfig
 # fastapi & cors → API banane ke liye aur CORS allow karne ke liye.
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from datetime import datetime
+from fastapi.responses import JSONResponse
+from openai.types.responses import (Response, ResponseCompletedEvent, ResponseFunctionToolCall,
+                                    ResponseOutputMessage, ResponseOutputText)
+from requests.adapters import HTTPAdapter
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Literal
 
 
 enable_verbose_stdout_logging()
@@ -20,13 +38,26 @@ enable_verbose_stdout_logging()
 # 🔒 Load env variables
 load_dotenv()
 OPENAI_API_KEY = os.getenv("API_KEY")
+# "mock" = offline benchmark model, Gemini key ki zaroorat nahi
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")
 ULTRAMSG_URL = os.getenv("Api_Url")
 TOKEN = os.getenv("Token")
+# Extra UltraMsg instances: "url|token,url|token" (throughput badhane ke liye)
+ULTRAMSG_INSTANCES = [tuple(item.strip().split("|", 1))
+                      for item in os.getenv("ULTRAMSG_INSTANCES", "").split(",") if item.strip()]
 
-if not OPENAI_API_KEY:
+if not OPENAI_API_KEY and LLM_PROVIDER != "mock":
     raise ValueError("❌ OPENAI_API_KEY is not set")
-if not ULTRAMSG_URL or not TOKEN:
+if not ULTRAMSG_INSTANCES and (not ULTRAMSG_URL or not TOKEN):
     raise ValueError("❌ WhatsApp configuration missing")
+if any(len(instance) != 2 for instance in ULTRAMSG_INSTANCES):
+    raise ValueError("❌ ULTRAMSG_INSTANCES must look like 'url|token,url|token'")
+if ULTRAMSG_URL and TOKEN and (ULTRAMSG_URL, TOKEN) not in ULTRAMSG_INSTANCES:
+    # Api_Url / Token wala sender hamesha pool mein, ULTRAMSG_INSTANCES uske ilawa hain
+    ULTRAMSG_INSTANCES.insert(0, (ULTRAMSG_URL, TOKEN))
+if not ULTRAMSG_URL or not TOKEN:
+    # post_whatsapp ke default sender: pehla instance
+    ULTRAMSG_URL, TOKEN = ULTRAMSG_INSTANCES[0]
 
 # 🚀 FastAPI app
 app = FastAPI()
@@ -44,95 +75,2298 @@ class ReminderInput(BaseModel):
     medicine_name: str
     dose_times: list[str]   # e.g. ["09:00:00", "14:00:00"]
     phone: str
+    source: Literal["clinic", "caregiver", "self"] = "self"   # agent queue mein priority
+
+
+# 🔌 Shared HTTP transport: keep-alive connection pool (sab dispatch workers share karte hain)
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+
+
+def make_http_session(pool_size: int) -> requests.Session:
+    session = requests.Session()
+    # pool_block → pool full ho to naya (throwaway) connection kholne ke bajaye wait karo
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=True)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+http_session = make_http_session(HTTP_POOL_SIZE)
+
+
+def http_stats() -> dict:
+    """Connection reuse across all pooled hosts (urllib3 per-pool counters)."""
+    sent = opened = 0
+    for adapter in {id(a): a for a in http_session.adapters.values()}.values():
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            sent += pool.num_requests
+            opened += pool.num_connections
+    return {
+        "pool_size": HTTP_POOL_SIZE,
+        "requests": sent,
+        "connections_opened": opened,
+        "reuse_rate": round(1 - opened / sent, 4) if sent else None,
+    }
+
+
+# 📲 Send WhatsApp Message (scheduler ke reminders seedha yahan aate hain)
+def post_whatsapp(phone: str, message: str, base_url: str = ULTRAMSG_URL, token: str = TOKEN,
+                  reference_id: str | None = None):
+    url = f"{base_url}messages/chat"
+    payload = f"token={token}&to={phone}&body={message}"
+    if reference_id:
+        # UltraMsg referenceId: outbox ki idempotency key message ke sath record hoti hai
+        payload += f"&referenceId={reference_id}"
+    headers = {"content-type": "application/x-www-form-urlencoded"}
 
+    try:
+        res = http_session.post(
+            url,
+            data=payload.encode("utf8").decode("iso-8859-1"),
+            headers=headers,
+            timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+        )
+        if res.status_code == 200:
+            print(f"✅ WhatsApp sent: {message}")
+            return {"status": "✅ WhatsApp message sent!", "code": res.status_code}
+        return {"status": f"❌ Failed: {res.text}", "code": res.status_code}
+    except Exception as e:
+        return {"status": f"❌ Error: {str(e)}"}
 
-# 📤 WhatsApp Request Schema
-class WhatsAppRequest(BaseModel):
-    phone: str
-    message: str
 
+# ⚡ Async HTTP client (app ke event loop pe, startup mein banta hai)
+ASYNC_MAX_IN_FLIGHT = int(os.getenv("ASYNC_MAX_IN_FLIGHT", "500"))
+async_http: httpx.AsyncClient | None = None
 
-# 📲 Send WhatsApp Message
-def send_whatsapp(data: WhatsAppRequest):
-    url = f"{ULTRAMSG_URL}messages/chat"
-    payload = f"token={TOKEN}&to={data.phone}&body={data.message}"
+
+def make_async_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=ASYNC_MAX_IN_FLIGHT, max_keepalive_connections=HTTP_POOL_SIZE),
+        timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+    )
+
+
+# 📲 Send WhatsApp Message (async version, thread block nahi karta)
+async def post_whatsapp_async(phone: str, message: str, base_url: str = ULTRAMSG_URL, token: str = TOKEN,
+                              reference_id: str | None = None):
+    url = f"{base_url}messages/chat"
+    payload = f"token={token}&to={phone}&body={message}"
+    if reference_id:
+        # UltraMsg referenceId: outbox ki idempotency key message ke sath record hoti hai
+        payload += f"&referenceId={reference_id}"
     headers = {"content-type": "application/x-www-form-urlencoded"}
 
     try:
-        res = requests.post(
+        res = await async_http.post(
             url,
-            data=payload.encode("utf8").decode("iso-8859-1"),
+            content=payload.encode("utf8"),
             headers=headers
         )
         if res.status_code == 200:
-            print(f"✅ WhatsApp sent: {data.message}")
-            return {"status": "✅ WhatsApp message sent!"}
-        return {"status": f"❌ Failed: {res.text}"}
+            print(f"✅ WhatsApp sent: {message}")
+            return {"status": "✅ WhatsApp message sent!", "code": res.status_code}
+        return {"status": f"❌ Failed: {res.text}", "code": res.status_code}
     except Exception as e:
         return {"status": f"❌ Error: {str(e)}"}
 
 
-# 🛠 Tool: Schedule Reminder
-@function_tool
-def schedule_reminder(phone: str, medicine: str, times: list[str]):
+# 📊 Latency / wait-time stats (metrics endpoint ke liye)
+class LatencyStats:
+    """Running count/average plus percentiles over the most recent samples."""
+
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        self._recent: deque[float] = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._recent.append(seconds)
+            self.count += 1
+            self.total += seconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            recent = sorted(self._recent)
+            count, total = self.count, self.total
+        if not recent:
+            return {"count": count}
+        pick = lambda q: round(recent[min(len(recent) - 1, int(q * len(recent)))] * 1000, 2)
+        return {
+            "count": count,
+            "avg_ms": round(total / count * 1000, 2),
+            "p50_ms": pick(0.50),
+            "p95_ms": pick(0.95),
+            "p99_ms": pick(0.99),
+            "max_ms": round(recent[-1] * 1000, 2),
+        }
+
+
+# 🕘 Har dose time ek hi shakal mein: "9:00 AM", "09:00", " 9:00:00" → "09:00:00"
+TIME_FORMATS = ("%I:%M %p", "%I:%M:%S %p", "%I %p", "%H:%M:%S", "%H:%M")
+
+
+def to_24h(t: str) -> str:
+    """Normalize a 12- or 24-hour dose time to "HH:MM:SS"; raise ValueError if it is neither."""
+    text = t.strip().upper()
+    for fmt in TIME_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).strftime("%H:%M:%S")
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid time format: {t!r}")
+
+
+# ⏰ Next fire time nikalna (local time, jaise schedule.every().day.at() karta tha)
+def next_fire_at(t_24: str, after: float | None = None) -> float:
     """
-    Schedule WhatsApp reminders for given medicine at specified times.
+    Return the next epoch timestamp (strictly after `after`) at which the
+    daily time `t_24` ("HH:MM" or "HH:MM:SS") occurs in local time.
+    """
+    after = time.time() if after is None else after
+    parts = [int(p) for p in t_24.split(":")]
+    if len(parts) not in (2, 3):
+        raise ValueError(f"Invalid time format: {t_24!r}")
+    hour, minute, second = (parts + [0])[:3]
+
+    day = datetime.fromtimestamp(after)
+    fire = day.replace(hour=hour, minute=minute, second=second, microsecond=0)
+    if fire.timestamp() <= after:
+        fire = (day + timedelta(days=1)).replace(hour=hour, minute=minute, second=second, microsecond=0)
+    return fire.timestamp()
+
+
+# 💊 Ek dose time ka reminder record
+# __slots__ (koi per-object __dict__ nahi); same phone / medicine / time ki ek hi
+# copy ReminderScheduler ki string table rakhti hai (sys.intern nahi: wo kabhi free nahi hota)
+@dataclass(eq=False, slots=True)
+class Reminder:
+    phone: str
+    medicine: str
+    t: str          # user ka diya hua original time (message mein dikhaya jata hai)
+    t_24: str       # normalized "HH:MM:SS"
+    next_fire_at: float = 0.0
+    cancelled: bool = False
+    id: int | None = None  # SQLite store ki row id
+    slot: set | None = field(default=None, repr=False)  # timing wheel ka bucket (O(1) cancel)
+
+    @property
+    def key(self) -> tuple[str, str, str]:
+        # Ek patient + medicine + time ka sirf ek reminder
+        return (self.phone, self.medicine, self.t_24)
+
+
+# 🗂 Backend 1: next-fire times ki min-heap (O(log n) insert / fire)
+class HeapBackend:
+    def __init__(self):
+        self._heap: list[tuple[float, int, Reminder]] = []
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, reminder: Reminder):
+        heapq.heappush(self._heap, (reminder.next_fire_at, next(self._seq), reminder))
+
+    def discard(self, reminder: Reminder):
+        # Lazy deletion: cancelled (ya pehle fire ho ke reschedule hua) entry pop hone pe skip ho jati hai
+        pass
+
+    def next_deadline(self) -> float | None:
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: float) -> list[Reminder]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            fire, _, reminder = heapq.heappop(self._heap)
+            if fire == reminder.next_fire_at:
+                due.append(reminder)
+        return due
+
+
+# 🎡 Backend 2: hierarchical timing wheel (O(1) insert / cancel / tick)
+class TimingWheelBackend:
+    """
+    Three wheels of buckets: 60 one-second slots, 60 one-minute slots and 24
+    one-hour slots. A reminder goes into the coarsest wheel that covers its
+    delay and is cascaded down to a finer wheel when that minute/hour starts.
+    Deadlines a day or more away wait in an overflow bucket that is re-checked
+    every hour.
     """
 
-    def job(phone=phone, medicine=medicine, t=None):
-        send_whatsapp(WhatsAppRequest(
-            phone=phone,
-            message=f"💊 Reminder: It's time to take your medicine '{medicine}' at {t}"
-        ))
+    def __init__(self, now: float | None = None):
+        self._current = int(time.time() if now is None else now)  # last processed second
+        self._seconds = [set() for _ in range(60)]
+        self._minutes = [set() for _ in range(60)]
+        self._hours = [set() for _ in range(24)]
+        self._overflow: set[Reminder] = set()
+        self._ready: set[Reminder] = set()
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def _place(self, reminder: Reminder, fire_sec: int):
+        delta = fire_sec - self._current
+        if delta <= 0:
+            slot = self._ready
+        elif delta < 60:
+            slot = self._seconds[fire_sec % 60]
+        elif delta < 3600:
+            slot = self._minutes[(fire_sec // 60) % 60]
+        elif delta < 86400:
+            slot = self._hours[(fire_sec // 3600) % 24]
+        else:
+            slot = self._overflow
+        slot.add(reminder)
+        reminder.slot = slot
+
+    def _cascade(self, slot: set):
+        pending = list(slot)
+        slot.clear()
+        for reminder in pending:
+            self._place(reminder, math.ceil(reminder.next_fire_at))
+
+    def push(self, reminder: Reminder):
+        self._place(reminder, math.ceil(reminder.next_fire_at))
+        self._count += 1
+
+    def discard(self, reminder: Reminder):
+        if reminder.slot is not None and reminder in reminder.slot:
+            reminder.slot.discard(reminder)
+            reminder.slot = None
+            self._count -= 1
+
+    def next_deadline(self) -> float | None:
+        if not self._count:
+            return None
+        if self._ready:
+            return self._current
+        # Agle 60 seconds mein koi bucket bhara hai? warna agle minute pe cascade
+        for step in range(1, 60 - self._current % 60):
+            if self._seconds[(self._current + step) % 60]:
+                return self._current + step
+        return self._current - self._current % 60 + 60
+
+    def pop_due(self, now: float) -> list[Reminder]:
+        target = int(now)
+        due = list(self._ready)
+        self._ready.clear()
+        while self._current < target:
+            self._current += 1
+            tick = self._current
+            if tick % 3600 == 0:
+                self._cascade(self._overflow)
+                self._cascade(self._hours[(tick // 3600) % 24])
+            if tick % 60 == 0:
+                self._cascade(self._minutes[(tick // 60) % 60])
+            due.extend(self._seconds[tick % 60])
+            self._seconds[tick % 60].clear()
+            due.extend(self._ready)
+            self._ready.clear()
+        for reminder in due:
+            reminder.slot = None
+        self._count -= len(due)
+        return due
+
+
+SCHEDULER_BACKENDS = {
+    "heap": HeapBackend,
+    "wheel": TimingWheelBackend,
+}
+
+
+# 🔀 Phone → shard (stable hash, har process aur restart mein same)
+def phone_hash(phone: str) -> int:
+    return zlib.crc32(phone.encode())
+
+
+# 💾 Durable Reminder Store (SQLite, WAL mode) → restart/deploy pe reminders survive karte hain
+class ReminderStore:
+    """
+    SQLite table of all reminders with an index on `next_fire_at`, so the
+    scheduler can read the next window of due reminders in fire order
+    without touching the rest of the table. A unique index on
+    (phone, medicine, t_24) makes adding an existing reminder a no-op.
 
-    # Add jobs in scheduler
-    for t in times:
+    Every row also carries its shard (`crc32(phone) % shards`), so each
+    shard process pages only its own reminders via (shard, next_fire_at).
+
+    Leases use their own connection and lock, and whole-table updates run
+    in id-range chunks, so a renewal never waits behind a long write.
+    """
+
+    CHUNK = 5000  # rebalance / roll_forward ek transaction mein itni rows
+
+    def __init__(self, path: str, shards: int = 1):
+        self.path = path
+        self.shards = shards
+        self._lock = threading.Lock()
+        self._lease_lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS reminders (
+                id INTEGER PRIMARY KEY,
+                phone TEXT NOT NULL,
+                medicine TEXT NOT NULL,
+                t TEXT NOT NULL,
+                t_24 TEXT NOT NULL,
+                next_fire_at REAL NOT NULL,
+                phone_hash INTEGER,
+                shard INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_reminders_next_fire_at ON reminders(next_fire_at);
+            CREATE INDEX IF NOT EXISTS idx_reminders_shard ON reminders(shard, next_fire_at);
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_reminders_key ON reminders(phone, medicine, t_24);
+            -- Leader election: ek row per lease, expire hone tak owner ke paas
+            CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            -- Non-leader workers ke add/cancel leader tak pohanchane ke liye
+            CREATE TABLE IF NOT EXISTS reminder_events (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                op TEXT NOT NULL,
+                reminder_id INTEGER,
+                phone TEXT NOT NULL,
+                medicine TEXT,
+                t_24 TEXT,
+                shard INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            -- Outbox: due reminder dispatch se pehle yahan likha jata hai, send ke baad 'sent'
+            CREATE TABLE IF NOT EXISTS outbox (
+                key TEXT PRIMARY KEY,
+                phone TEXT NOT NULL,
+                medicines TEXT NOT NULL,
+                t TEXT NOT NULL,
+                t_24 TEXT NOT NULL,
+                due_at REAL NOT NULL,
+                shard INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_outbox_status ON outbox(status, shard);
+            -- UltraMsg rate limit: saare workers / shards ek hi bucket se tokens lete hain
+            CREATE TABLE IF NOT EXISTS rate_buckets (
+                name TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            -- REMINDER_ASYNC_API: background request ka status, har worker se GET ho sakta hai
+            CREATE TABLE IF NOT EXISTS jobs (
+                request_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_created_at ON jobs(created_at);
+        """)
+        # Nayi DB: shard count abhi se likh do (rebalance sirf count badalne pe chale)
+        self._db.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('shards', ?)", (str(shards),))
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_reminders_medicine ON reminders(medicine)")
+        self._db.commit()
+        self._lease_db = sqlite3.connect(path, check_same_thread=False)
+
+    def shard_for(self, phone: str) -> int:
+        return phone_hash(phone) % self.shards
+
+    def _ranges(self, table: str) -> list[tuple[int, int]]:
+        """(lo, hi] rowid ranges of CHUNK rows covering `table`."""
+        with self._lock:
+            top = self._db.execute(f"SELECT MAX(rowid) FROM {table}").fetchone()[0] or 0
+        return [(lo, lo + self.CHUNK) for lo in range(0, top, self.CHUNK)]
+
+    def rebalance(self):
+        """Reassign every row to `crc32(phone) % shards` if the shard count changed since last run."""
+        with self._lock:
+            row = self._db.execute("SELECT value FROM meta WHERE key = 'shards'").fetchone()
+        if row is not None and int(row[0]) == self.shards:
+            return
+        print(f"🔀 Rebalancing reminders across {self.shards} shard(s)")
+        # Chunk by chunk: beech mein crash ho to meta purana rehta hai → agli start pe dobara poora rebalance
+        for lo, hi in self._ranges("reminders"):
+            with self._lock, self._db:
+                self._db.execute("UPDATE reminders SET shard = phone_hash % ? WHERE id > ? AND id <= ?",
+                                 (self.shards, lo, hi))
+        # Outbox mein phone_hash nahi → har phone ka shard yahin nikalo (pending rows sahi shard pe replay hon)
+        for lo, hi in self._ranges("outbox"):
+            with self._lock, self._db:
+                rows = self._db.execute("SELECT rowid, phone FROM outbox WHERE rowid > ? AND rowid <= ?",
+                                        (lo, hi)).fetchall()
+                self._db.executemany("UPDATE outbox SET shard = ? WHERE rowid = ?",
+                                     [(self.shard_for(phone), rowid) for rowid, phone in rows])
+        with self._lock, self._db:
+            # Shards start pe poori window store se dobara page karte hain, purane events ki zaroorat nahi
+            self._db.execute("DELETE FROM reminder_events")
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('shards', ?)", (str(self.shards),))
+
+    def add(self, reminder: Reminder) -> bool:
+        """Insert `reminder`; return False (and leave it unsaved) if the same key already exists."""
+        hashed = phone_hash(reminder.phone)
+        with self._lock, self._db:
+            cur = self._db.execute(
+                "INSERT INTO reminders (phone, medicine, t, t_24, next_fire_at, phone_hash, shard) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (phone, medicine, t_24) DO NOTHING",
+                (reminder.phone, reminder.medicine, reminder.t, reminder.t_24, reminder.next_fire_at,
+                 hashed, hashed % self.shards),
+            )
+        if not cur.rowcount:
+            return False
+        reminder.id = cur.lastrowid
+        return True
+
+    def _where(self, phone: str | None, medicine: str | None, t_24: str | None) -> tuple[str, list]:
+        clauses, args = [], []
+        for column, value in (("phone", phone), ("medicine", medicine), ("t_24", t_24)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                args.append(value)
+        return " AND ".join(clauses) or "1", args
+
+    def find(self, phone: str | None = None, medicine: str | None = None) -> list[Reminder]:
+        where, args = self._where(phone, medicine, None)
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT id, phone, medicine, t, t_24, next_fire_at FROM reminders WHERE {where} ORDER BY t_24",
+                args,
+            ).fetchall()
+        return [Reminder(phone=phone, medicine=medicine, t=t, t_24=t_24, next_fire_at=fire_at, id=rid)
+                for rid, phone, medicine, t, t_24, fire_at in rows]
+
+    def find_page(self, phone: str | None, medicine: str | None, after: int = 0, limit: int = 100) -> list[Reminder]:
+        """Like `find`, but only `limit` rows with id > `after`, in id order (keyset pagination)."""
+        where, args = self._where(phone, medicine, None)
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT id, phone, medicine, t, t_24, next_fire_at FROM reminders WHERE {where} AND id > ? "
+                "ORDER BY id LIMIT ?",
+                (*args, after, limit),
+            ).fetchall()
+        return [Reminder(phone=phone, medicine=medicine, t=t, t_24=t_24, next_fire_at=fire_at, id=rid)
+                for rid, phone, medicine, t, t_24, fire_at in rows]
+
+    def delete(self, phone: str, medicine: str | None = None, t_24: str | None = None) -> int:
+        where, args = self._where(phone, medicine, t_24)
+        with self._lock, self._db:
+            return self._db.execute(f"DELETE FROM reminders WHERE {where}", args).rowcount
+
+    def get(self, reminder_id: int) -> Reminder | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, phone, medicine, t, t_24, next_fire_at FROM reminders WHERE id = ?", (reminder_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        rid, phone, medicine, t, t_24, fire_at = row
+        return Reminder(phone=phone, medicine=medicine, t=t, t_24=t_24, next_fire_at=fire_at, id=rid)
+
+    def publish(self, op: str, phone: str, medicine: str | None = None, t_24: str | None = None,
+                reminder_id: int | None = None):
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO reminder_events (op, reminder_id, phone, medicine, t_24, shard) VALUES (?, ?, ?, ?, ?, ?)",
+                (op, reminder_id, phone, medicine, t_24, self.shard_for(phone)),
+            )
+
+    def take_events(self, shard: int | None = None, limit: int = 1000) -> list[tuple]:
+        """Pop the oldest forwarded events (of one shard) as (op, reminder_id, phone, medicine, t_24)."""
+        where, args = ("shard = ?", [shard]) if shard is not None else ("1", [])
+        with self._lock, self._db:
+            rows = self._db.execute(
+                f"SELECT seq, op, reminder_id, phone, medicine, t_24 FROM reminder_events WHERE {where} "
+                "ORDER BY seq LIMIT ?",
+                (*args, limit),
+            ).fetchall()
+            if rows:
+                self._db.execute(f"DELETE FROM reminder_events WHERE {where} AND seq <= ?", (*args, rows[-1][0]))
+        return [row[1:] for row in rows]
+
+    def leases(self) -> list[dict]:
+        now = time.time()
+        with self._lease_lock:
+            rows = self._lease_db.execute("SELECT name, owner, expires_at FROM leases ORDER BY name").fetchall()
+        return [{"name": name, "owner": owner, "expires_in": round(expires_at - now, 1)}
+                for name, owner, expires_at in rows]
+
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        """Take or renew lease `name` for `owner`; False if someone else holds an unexpired one."""
+        now = time.time()
+        with self._lease_lock, self._lease_db:
+            cur = self._lease_db.execute(
+                "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE leases.owner = excluded.owner OR leases.expires_at < ?",
+                (name, owner, now + ttl, now),
+            )
+        return cur.rowcount == 1
+
+    def release_lease(self, name: str, owner: str):
+        with self._lease_lock, self._lease_db:
+            self._lease_db.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+    def save_job(self, request_id: str, status: str, result: dict | None = None, error: str | None = None):
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO jobs (request_id, status, result, error, created_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (request_id) DO UPDATE SET status = excluded.status, result = excluded.result, "
+                "error = excluded.error",
+                (request_id, status, json.dumps(result) if result is not None else None, error, time.time()),
+            )
+
+    def get_job(self, request_id: str) -> dict | None:
+        with self._lock:
+            row = self._db.execute("SELECT status, result, error FROM jobs WHERE request_id = ?",
+                                   (request_id,)).fetchone()
+        if row is None:
+            return None
+        status, result, error = row
+        job = {"request_id": request_id, **(json.loads(result) if result else {}), "status": status}
+        if error is not None:
+            job["error"] = error
+        return job
+
+    def prune_jobs(self, keep: int):
+        """Keep only the newest `keep` jobs."""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM jobs WHERE request_id IN "
+                             "(SELECT request_id FROM jobs ORDER BY created_at DESC LIMIT -1 OFFSET ?)", (keep,))
+
+    def reserve_token(self, name: str, rate: float, burst: float) -> float:
+        """Take one token from shared bucket `name` (balance may go negative); return seconds to wait."""
+        with self._lock, self._db:
+            tokens = self._db.execute(
+                "INSERT INTO rate_buckets (name, tokens, updated_at) VALUES (:name, :burst - 1, :now) "
+                "ON CONFLICT (name) DO UPDATE SET "
+                "tokens = min(:burst, tokens + max(0, excluded.updated_at - updated_at) * :rate) - 1, "
+                "updated_at = max(updated_at, excluded.updated_at) "
+                "RETURNING tokens",
+                {"name": name, "rate": rate, "burst": burst, "now": time.time()},
+            ).fetchone()[0]
+        return -tokens / rate if tokens < 0 else 0.0
+
+    def advance(self, reminders: list[Reminder]):
+        """Save the new `next_fire_at` of a whole tick's fired reminders in one transaction."""
+        with self._lock, self._db:
+            self._db.executemany("UPDATE reminders SET next_fire_at = ? WHERE id = ?",
+                                 [(r.next_fire_at, r.id) for r in reminders])
+
+    def roll_forward(self, before: float, shard: int | None = None):
+        """Move reminders missed before `before` (e.g. during downtime) to their next daily slot."""
+        where, args = ("AND shard = ?", [shard]) if shard is not None else ("", [])
+        while True:
+            # Rolled rows `before` ke baad chali jati hain → har chunk agli missed rows uthata hai
+            with self._lock, self._db:
+                cur = self._db.execute(
+                    "UPDATE reminders SET next_fire_at = next_fire_at + 86400 * (CAST((? - next_fire_at) / 86400 AS INTEGER) + 1) "
+                    f"WHERE id IN (SELECT id FROM reminders WHERE next_fire_at < ? {where} LIMIT ?)",
+                    (before, before, *args, self.CHUNK),
+                )
+            if cur.rowcount < self.CHUNK:
+                return
+
+    def journal(self, messages: list[tuple[str, list[Reminder]]]) -> set[str]:
+        """
+        Write a tick's due messages (key, reminders) to the outbox in one
+        transaction; return the keys that were new (the rest were journaled
+        before, already sent or pending).
+        """
+        keys = [key for key, _ in messages]
+        now = time.time()
+        with self._lock, self._db:
+            seen = set()
+            for i in range(0, len(keys), 500):  # SQLite ke bound-parameter limit ke andar
+                chunk = keys[i:i + 500]
+                seen.update(row[0] for row in self._db.execute(
+                    f"SELECT key FROM outbox WHERE key IN ({','.join('?' * len(chunk))})", chunk))
+            rows = []
+            for key, reminders in messages:
+                if key in seen:
+                    continue
+                seen.add(key)
+                first = reminders[0]
+                rows.append((key, first.phone, json.dumps([r.medicine for r in reminders]), first.t, first.t_24,
+                             first.next_fire_at, self.shard_for(first.phone), now))
+            # ON CONFLICT: doosra (purana) leader isi waqt likh de to bhi duplicate row nahi
+            self._db.executemany(
+                "INSERT INTO outbox (key, phone, medicines, t, t_24, due_at, shard, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (key) DO NOTHING",
+                rows,
+            )
+        return {row[0] for row in rows}
+
+    def settle(self, key: str, status: str, attempts: int, error: str | None = None):
+        with self._lock, self._db:
+            self._db.execute("UPDATE outbox SET status = ?, attempts = ?, error = ?, updated_at = ? WHERE key = ?",
+                             (status, attempts, error, time.time(), key))
+
+    def unsent(self, shard: int | None = None) -> list[tuple]:
+        """Pending outbox rows (of one shard) as (key, phone, medicines, t, t_24, due_at), oldest first."""
+        where, args = ("AND shard = ?", [shard]) if shard is not None else ("", [])
+        with self._lock:
+            return self._db.execute(
+                f"SELECT key, phone, medicines, t, t_24, due_at FROM outbox WHERE status = 'pending' {where} "
+                "ORDER BY due_at",
+                args,
+            ).fetchall()
+
+    def dead_letters(self, after: int = 0, limit: int = 100) -> list[tuple]:
+        """Failed outbox rows with rowid > `after` as (id, key, phone, medicines, t, due_at, attempts, error, failed_at)."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT rowid, key, phone, medicines, t, due_at, attempts, error, updated_at FROM outbox "
+                "WHERE status = 'failed' AND rowid > ? ORDER BY rowid LIMIT ?",
+                (after, limit),
+            ).fetchall()
+
+    def count_dead_letters(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM outbox WHERE status = 'failed'").fetchone()[0]
+
+    def claim_dead_letters(self, limit: int) -> list[tuple]:
+        """Move up to `limit` failed rows back to pending; return them as (key, phone, medicines, t, t_24)."""
+        with self._lock, self._db:
+            return self._db.execute(
+                "UPDATE outbox SET status = 'pending', attempts = 0, error = NULL, updated_at = ? "
+                "WHERE rowid IN (SELECT rowid FROM outbox WHERE status = 'failed' ORDER BY rowid LIMIT ?) "
+                "RETURNING key, phone, medicines, t, t_24",
+                (time.time(), limit),
+            ).fetchall()
+
+    def prune_outbox(self, before: float) -> int:
+        with self._lock, self._db:
+            return self._db.execute("DELETE FROM outbox WHERE status = 'sent' AND updated_at < ?",
+                                    (before,)).rowcount
+
+    def page(self, after: tuple[float, int], until: float, limit: int, shard: int | None = None) -> list[Reminder]:
+        """Reminders (of one shard) ordered by (next_fire_at, id) strictly after `after` and due by `until`."""
+        where, args = ("AND shard = ?", [shard]) if shard is not None else ("", [])
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, phone, medicine, t, t_24, next_fire_at FROM reminders "
+                f"WHERE (next_fire_at, id) > (?, ?) AND next_fire_at <= ? {where} "
+                "ORDER BY next_fire_at, id LIMIT ?",
+                (*after, until, *args, limit),
+            ).fetchall()
+        return [Reminder(phone=phone, medicine=medicine, t=t, t_24=t_24, next_fire_at=fire_at, id=rid)
+                for rid, phone, medicine, t, t_24, fire_at in rows]
+
+
+# 🗓 Scheduler Engine: backend ke upar deadline-driven loop
+class ReminderScheduler:
+    """
+    Deadline-driven scheduler. The loop sleeps until the backend's earliest
+    deadline and is woken early whenever a new reminder is due before it.
+
+    With a store attached, only reminders due within the next `horizon`
+    seconds are kept in memory; the rest are paged in from the store (in
+    `page_size` chunks) as the window moves forward.
+
+    Each tick's due reminders are handed to `fire` as one list of batches,
+    so the outbox can journal them in a single transaction. With `coalesce`
+    on, a batch holds all of one patient's reminders due in the same clock
+    minute, so they go out as a single message: when the first of them
+    fires, the later ones (e.g. 08:00:30 after 08:00:00) are taken out of
+    the backend and sent with it.
+
+    Only the process running the loop (the leader) holds reminders in memory.
+    Other processes write to the store and publish add/cancel events there,
+    which the leader applies every `forward_poll` seconds.
+
+    A failing pass (e.g. "database is locked") is logged and retried; the
+    loop stamps a heartbeat every pass so `alive()` can tell the lease
+    holder when it has died or hung.
+    """
+
+    # Wall clock change (NTP/DST) ko pakadne ke liye max itni der soyenge
+    MAX_SLEEP = 60.0
+    # Itni der koi pass na ho to loop mara hua / atka hua samjho
+    STALL_AFTER = 2 * MAX_SLEEP
+    # Error ke baad dobara koshish se pehle
+    ERROR_BACKOFF = 1.0
+
+    def __init__(self, backend=None, store: ReminderStore | None = None,
+                 horizon: float = 3600.0, page_size: int = 10_000, missed_grace: float = 300.0,
+                 forward_poll: float = 1.0, coalesce: bool = True):
+        self.backend = backend if backend is not None else HeapBackend()
+        self.store = store
+        self.horizon = horizon
+        self.page_size = page_size
+        self.missed_grace = missed_grace
+        self.forward_poll = forward_poll
+        self.coalesce = coalesce
+        self.fired = 0      # kitne reminders fire hue
+        self.messages = 0   # kitne WhatsApp messages bane (coalescing ke baad)
+        self.shard: int | None = None  # sharded mode mein sirf is shard ke reminders
+        self.leading = False
+        self._generation = 0  # har start/stop pe badhta hai; purana loop khud ruk jata hai
+        self._heartbeat: float | None = None  # loop ka last pass (None → loop nahi chal raha)
+        self._cond = threading.Condition()
+        # add / cancel ki store write + memory update ek sath (scheduler loop isko nahi rokta)
+        self._write_lock = threading.Lock()
+        self._wake_at = math.inf  # loop is waqt tak so raha hai
+        # Store se kahan tak (next_fire_at, id) memory mein load ho chuka hai
+        self._loaded = (-math.inf, 0) if store is not None else (math.inf, 0)
+        self._window_end = -math.inf
+        self.lag = LatencyStats()  # deadline ke kitni der baad fire hua
+        # Memory mein loaded reminders: (phone, medicine, t_24) → Reminder,
+        # aur phone se unke handles (cancel ke liye, poori list scan nahi)
+        self._by_key: dict[tuple[str, str, str], Reminder] = {}
+        self._by_phone: dict[str, dict[tuple, Reminder]] = {}
+        # Loaded reminders ke strings ki ek copy + kitne reminders use kar rahe; 0 pe hata dete hain
+        self._strings: dict[str, str] = {}
+        self._refs: dict[str, int] = {}
+        # Async mode (run_async) mein event loop ko jagane ke liye
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wakeup: asyncio.Event | None = None
+
+    def __len__(self):
+        return len(self.backend)
+
+    def _push(self, reminder: Reminder):
+        self.backend.push(reminder)
+        self._index(reminder)
+        # Sirf tab jagana hai jab naya reminder current deadline se pehle due ho
+        if reminder.next_fire_at < self._wake_at:
+            self._cond.notify()
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _share(self, s: str) -> str:
+        s = self._strings.setdefault(s, s)
+        self._refs[s] = self._refs.get(s, 0) + 1
+        return s
+
+    def _unshare(self, s: str):
+        refs = self._refs[s] - 1
+        if refs:
+            self._refs[s] = refs
+        else:
+            del self._refs[s], self._strings[s]
+
+    def _index(self, reminder: Reminder):
+        indexed = self._by_key.get(reminder.key)
+        if indexed is reminder:
+            return  # fire ke baad dobara push: strings pehle se gine hue
+        if indexed is not None:
+            self._forget(indexed)
+        reminder.phone = self._share(reminder.phone)
+        reminder.medicine = self._share(reminder.medicine)
+        reminder.t = self._share(reminder.t)
+        reminder.t_24 = self._share(reminder.t_24)
+        key = reminder.key
+        self._by_key[key] = reminder
+        self._by_phone.setdefault(reminder.phone, {})[key] = reminder
+
+    def _forget(self, reminder: Reminder):
+        key = reminder.key
+        if self._by_key.get(key) is not reminder:
+            return
+        del self._by_key[key]
+        handles = self._by_phone[reminder.phone]
+        del handles[key]
+        if not handles:
+            del self._by_phone[reminder.phone]
+        for s in (reminder.phone, reminder.medicine, reminder.t, reminder.t_24):
+            self._unshare(s)
+
+    def add(self, reminder: Reminder) -> bool:
+        """Upsert: return False (no-op) if the same (phone, medicine, time) is already scheduled."""
+        with self._write_lock:
+            with self._cond:
+                if reminder.key in self._by_key:
+                    return False
+            # Store I/O _cond ke bahar: scheduler loop (paging / firing) isse nahi rukta
+            if self.store is not None and not self.store.add(reminder):
+                return False
+            with self._cond:
+                if reminder.key in self._by_key:
+                    return True  # beech mein page_in ne store se load kar liya
+                # Window se bahar wale reminders baad mein store se page honge
+                if (reminder.next_fire_at, reminder.id or 0) <= self._loaded:
+                    self._push(reminder)
+                    return True
+            if self.store is not None and not self.leading:
+                # Hum leader nahi → leader ko store ke through batao
+                self.store.publish("add", reminder.phone, reminder_id=reminder.id)
+            return True
+
+    def cancel(self, reminder: Reminder):
+        with self._cond:
+            reminder.cancelled = True
+            self.backend.discard(reminder)
+            self._forget(reminder)
+
+    def _handles(self, phone: str | None, medicine: str | None) -> list[Reminder]:
+        if phone is not None:
+            handles = self._by_phone.get(phone, {}).values()
+            return [r for r in handles if medicine is None or r.medicine == medicine]
+        # Sirf medicine se (store ke baghair): loaded reminders scan
+        return [r for r in self._by_key.values() if r.medicine == medicine]
+
+    def cancel_where(self, phone: str, medicine: str | None = None, t_24: str | None = None) -> int:
+        """Cancel a patient's reminders (optionally one medicine / one time); return how many."""
+        with self._write_lock:
+            # Pehle store se delete: uske baad page_in inhe dobara load nahi kar sakta
+            deleted = self.store.delete(phone, medicine, t_24) if self.store is not None else None
+            with self._cond:
+                cancelled = 0
+                for reminder in self._handles(phone, medicine):
+                    if t_24 is None or reminder.t_24 == t_24:
+                        self.cancel(reminder)
+                        cancelled += 1
+            if deleted is None:
+                return cancelled
+            if deleted and not self.leading:
+                self.store.publish("cancel", phone, medicine, t_24)
+            return deleted
+
+    def find(self, phone: str | None = None, medicine: str | None = None) -> list[Reminder]:
+        """All reminders for a phone and/or medicine (from the store if there is one)."""
+        if self.store is not None:
+            return self.store.find(phone, medicine)
+        with self._cond:
+            return sorted(self._handles(phone, medicine), key=lambda r: r.t_24)
+
+    def pop_due(self, now: float) -> list[Reminder]:
+        with self._cond:
+            return self.backend.pop_due(now)
+
+    def page_in(self, now: float) -> bool:
+        """Load the next page of the preload window; return True if more rows may be pending."""
+        if self.store is None:
+            return False
+        if self._window_end == -math.inf:
+            # Startup: downtime mein jo reminders bahut pehle miss hue wo agle din pe
+            self.store.roll_forward(now - self.missed_grace, self.shard)
+        with self._cond:
+            self._window_end = max(self._window_end, now + self.horizon)
+            page = self.store.page(self._loaded, self._window_end, self.page_size, self.shard)
+            for reminder in page:
+                self.backend.push(reminder)
+                self._index(reminder)
+            if len(page) == self.page_size:
+                self._loaded = (page[-1].next_fire_at, page[-1].id)
+                return True
+            self._loaded = (self._window_end, math.inf)
+            return False
+
+    def _begin(self) -> int:
+        """Start leading with a fresh in-memory window; return this run's generation."""
+        with self._cond:
+            self._generation += 1
+            self.leading = True
+            self._heartbeat = time.time()
+            self._reset_window()
+            return self._generation
+
+    def _reset_window(self):
+        if self.store is None:
+            return
+        # Store hi source of truth hai: memory khali karo, zaroorat pe dobara page hoga
+        self.backend = type(self.backend)()
+        self._by_key, self._by_phone = {}, {}
+        self._strings, self._refs = {}, {}
+        self._loaded, self._window_end = (-math.inf, 0), -math.inf
+
+    def stop(self):
+        """Stop the running loop (e.g. leadership lost); it exits at its next wake-up."""
+        with self._cond:
+            self._generation += 1
+            self.leading = False
+            self._heartbeat = None
+            self._reset_window()
+            self._cond.notify_all()
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _apply_events(self, now: float, poll_at: float) -> float:
+        """Apply add/cancel events forwarded by other processes; return the next poll time."""
+        if self.store is None or now < poll_at:
+            return poll_at
+        for op, reminder_id, phone, medicine, t_24 in self.store.take_events(self.shard):
+            if op == "cancel":
+                with self._cond:
+                    for reminder in self._handles(phone, medicine):
+                        if t_24 is None or reminder.t_24 == t_24:
+                            self.cancel(reminder)
+                continue
+            # Write lock: get aur push ke beech is worker ka apna cancel_where na aa sake
+            with self._write_lock:
+                reminder = self.store.get(reminder_id)
+                with self._cond:
+                    if (reminder is not None and reminder.key not in self._by_key
+                            and (reminder.next_fire_at, reminder.id) <= self._loaded):
+                        self._push(reminder)
+        return now + self.forward_poll
+
+    def wait_for_due(self, limit: float = math.inf, generation: int | None = None) -> float:
+        """Block until the next deadline (or `limit`) has passed; return the current time."""
+        with self._cond:
+            while True:
+                now = time.time()
+                deadline = self.backend.next_deadline()
+                if ((deadline is not None and deadline <= now) or now >= limit
+                        or (generation is not None and generation != self._generation)):
+                    self._wake_at = math.inf
+                    return now
+                self._wake_at = min(deadline if deadline is not None else math.inf, limit)
+                self._cond.wait(min(self.MAX_SLEEP, self._wake_at - now))
+
+    def _refill(self, now: float, refill_at: float) -> float:
+        """Page the store in if the preload window is half used; return the next refill time."""
+        if now < refill_at:
+            return refill_at
+        # Window aadhi khatam ho gayi → agla hissa store se load karo
+        more = self.page_in(now)
+        return now if more else now + self.horizon / 2
+
+    def _batches(self, due: list[Reminder]) -> list[list[Reminder]]:
+        if not self.coalesce:
+            return [[reminder] for reminder in due]
+        # Ek patient ke same minute wale saare medicines → ek hi WhatsApp message
+        groups: dict[tuple[str, int], list[Reminder]] = {}
+        for reminder in due:
+            groups.setdefault((reminder.phone, int(reminder.next_fire_at // 60)), []).append(reminder)
+        return list(groups.values())
+
+    def _same_minute(self, due: list[Reminder]) -> list[Reminder]:
+        """Take the due patients' later reminders in the same clock minute out of the backend."""
+        minutes: dict[str, set[int]] = {}
+        for reminder in due:
+            minutes.setdefault(reminder.phone, set()).add(int(reminder.next_fire_at // 60))
+        taken = {id(reminder) for reminder in due}
+        early = []
+        with self._cond:
+            for phone, phone_minutes in minutes.items():
+                for reminder in self._by_phone.get(phone, {}).values():
+                    if (id(reminder) not in taken and not reminder.cancelled
+                            and int(reminder.next_fire_at // 60) in phone_minutes):
+                        self.backend.discard(reminder)
+                        early.append(reminder)
+        return early
+
+    def _fire_due(self, now: float, fire, generation: int):
+        """Hand this tick's due batches to `fire` in one call, then reschedule them all at once."""
+        # Failed pass ke wapas push kiye reminders heap mein do dafa ho sakte hain → id se ek
+        due = list({id(reminder): reminder for reminder in self.pop_due(now) if not reminder.cancelled}.values())
+        if not due or generation != self._generation:
+            return  # leadership chali gayi → naya leader store se fire karega
+        for reminder in due:
+            self.lag.record(now - reminder.next_fire_at)
+        if self.coalesce:
+            # Isi minute ke baqi doses (e.g. 08:00:30) abhi ke message mein, alag message nahi
+            due += self._same_minute(due)
+        batches = self._batches(due)
         try:
-            # 12-hour format ko 24-hour mein convert karna
-            t_24 = datetime.strptime(t.strip(), "%I:%M %p").strftime("%H:%M:%S")
-        except:
-            # Agar already HH:MM:SS diya hai to same rakho
-            t_24 = t
+            fire(batches)
+        except Exception:
+            # Journal/submit fail → reminders wapas backend mein, agle pass pe dobara fire
+            with self._cond:
+                if generation == self._generation:
+                    for reminder in due:
+                        if not reminder.cancelled:
+                            self._push(reminder)
+            raise
+        self.fired += len(due)
+        self.messages += len(batches)
+        for reminder in due:
+            # Daily reminder: agle din ke liye dobara schedule
+            reminder.next_fire_at = next_fire_at(reminder.t_24, reminder.next_fire_at)
+        if generation != self._generation:
+            return
+        try:
+            if self.store is not None:
+                self.store.advance(due)
+        finally:
+            # Store update fail ho tab bhi kal ka slot memory mein rahe (warna reminder gum)
+            with self._cond:
+                if generation == self._generation:
+                    for reminder in due:
+                        if reminder.cancelled:
+                            continue  # advance ke dauran cancel hua
+                        if (reminder.next_fire_at, reminder.id or 0) <= self._loaded:
+                            self._push(reminder)
+                        else:
+                            self._forget(reminder)
+
+    def alive(self) -> bool:
+        """False if the loop was started but has not made a pass in `STALL_AFTER` seconds."""
+        heartbeat = self._heartbeat
+        return heartbeat is None or time.time() - heartbeat < self.STALL_AFTER
+
+    def run(self, fire):
+        generation = self._begin()
+        refill_at = poll_at = -math.inf
+        while generation == self._generation:
+            self._heartbeat = time.time()
+            try:
+                now = self.wait_for_due(min(refill_at, poll_at), generation)
+                refill_at = self._refill(now, refill_at)
+                poll_at = self._apply_events(now, poll_at)
+                self._fire_due(now, fire, generation)
+            except Exception as e:
+                # e.g. SQLite "database is locked": thread marna nahi chahiye, thodi der baad dobara
+                print(f"❌ Scheduler error: {e}")
+                with self._cond:
+                    self._cond.wait(self.ERROR_BACKOFF)
+
+    async def run_async(self, fire):
+        """
+        Same loop as `run`, but sleeping on the app's event loop instead of a
+        thread. Paging, forwarded events and firing (all store I/O) run in a
+        worker thread, so `fire` is called off the loop too.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        generation = self._begin()
+        refill_at = poll_at = -math.inf
+        while generation == self._generation:
+            self._heartbeat = time.time()
+            with self._cond:
+                now = time.time()
+                deadline = self.backend.next_deadline()
+                limit = min(refill_at, poll_at)
+                ready = (deadline is not None and deadline <= now) or now >= limit
+                self._wake_at = math.inf if ready else min(deadline if deadline is not None else math.inf, limit)
+                self._wakeup.clear()
+            if not ready:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), min(self.MAX_SLEEP, self._wake_at - now))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            # SQLite I/O loop pe nahi: HTTP requests beech mein chalti rehti hain
+            try:
+                refill_at = await asyncio.to_thread(self._refill, now, refill_at)
+                poll_at = await asyncio.to_thread(self._apply_events, now, poll_at)
+                await asyncio.to_thread(self._fire_due, now, fire, generation)
+            except Exception as e:
+                print(f"❌ Scheduler error: {e}")
+                await asyncio.sleep(self.ERROR_BACKOFF)
+
+    def stats(self) -> dict:
+        return {"backend": type(self.backend).__name__, "leading": self.leading, "in_memory": len(self),
+                "strings": len(self._strings),
+                "fired": self.fired, "messages": self.messages, "lag": self.lag.snapshot()}
+
+
+SCHEDULER_BACKEND = os.getenv("SCHEDULER_BACKEND", "heap")
+if SCHEDULER_BACKEND not in SCHEDULER_BACKENDS:
+    raise ValueError(f"❌ Unknown SCHEDULER_BACKEND: {SCHEDULER_BACKEND}")
+
+REMINDER_DB = os.getenv("REMINDER_DB", "reminders.db")
+SCHEDULER_SHARDS = int(os.getenv("SCHEDULER_SHARDS", "1"))
+COALESCE_REMINDERS = os.getenv("COALESCE_REMINDERS", "1") == "1"
+PRELOAD_MINUTES = float(os.getenv("PRELOAD_MINUTES", "60"))
+STORE_PAGE_SIZE = int(os.getenv("STORE_PAGE_SIZE", "10000"))
+
+scheduler = ReminderScheduler(
+    SCHEDULER_BACKENDS[SCHEDULER_BACKEND](),
+    store=ReminderStore(REMINDER_DB, shards=SCHEDULER_SHARDS),
+    horizon=PRELOAD_MINUTES * 60,
+    page_size=STORE_PAGE_SIZE,
+    coalesce=COALESCE_REMINDERS,
+)
+
+
+# 🪣 Token Bucket: UltraMsg rate limit ke andar rehne ke liye
+class TokenBucket:
+    """
+    `rate` tokens per second, holding at most `burst`. `reserve()` always
+    takes a token (the balance may go negative) and returns how long the
+    caller must wait, so over-limit sends queue up in order instead of
+    being dropped.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def take(self) -> float:
+        """Take a token if one is available (return 0.0); else take nothing and return the wait for one."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return (1 - self.tokens) / self.rate
+            self.tokens -= 1
+            return 0.0
+
+
+# 🪣 Shared Token Bucket: wahi bucket, magar state store mein (saare processes ke liye ek)
+class SharedTokenBucket:
+    """
+    `TokenBucket` whose balance lives in the store's `rate_buckets` table,
+    so every uvicorn worker and shard process sending through the same
+    UltraMsg instance draws from one budget. Each `reserve()` is a single
+    upsert.
+    """
+
+    def __init__(self, store: ReminderStore, name: str, rate: float, burst: float):
+        self.store = store
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+
+    def reserve(self) -> float:
+        return self.store.reserve_token(self.name, self.rate, self.burst)
 
-        schedule.every().day.at(t_24).do(job, t=t)
-        print(f"⏰ Reminder scheduled at {t_24} (original: {t})")
+
+class SendRateLimiter:
+    """
+    One global bucket per UltraMsg (url, token) instance plus one bucket per
+    recipient phone (LRU-capped at `max_phones`). A send waits for its
+    instance's bucket; a phone over its budget is not waited on here:
+    `phone_delay` says how long, and the send is re-queued for later.
+
+    With a `store`, the instance buckets are shared by all processes (shard
+    processes, DLQ replays in other workers), so UltraMsg sees at most
+    `rate` per instance in total. Phone buckets stay per process: all of a
+    phone's scheduled sends come from the one shard that owns it.
+    """
+
+    def __init__(self, rate: float, burst: float, phone_rate: float, phone_burst: float,
+                 max_phones: int = 100_000, store: ReminderStore | None = None):
+        self.store = store
+        self.rate, self.burst = rate, burst
+        self.phone_rate, self.phone_burst = phone_rate, phone_burst
+        self.max_phones = max_phones
+        self.wait = LatencyStats()
+        self.waiting = 0
+        self._instances: dict[tuple[str, str], TokenBucket] = {}
+        self._phones: OrderedDict[str, TokenBucket] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def phone_delay(self, phone: str) -> float:
+        """0.0 (token taken) if `phone` may get a message now, else seconds until it may."""
+        with self._lock:
+            bucket = self._phones.get(phone)
+            if bucket is None:
+                bucket = self._phones[phone] = TokenBucket(self.phone_rate, self.phone_burst)
+                while len(self._phones) > self.max_phones:
+                    self._phones.popitem(last=False)
+            else:
+                self._phones.move_to_end(phone)
+        return bucket.take()
+
+    def delay(self, instance: tuple[str, str]) -> float:
+        with self._lock:
+            bucket = self._instances.get(instance)
+            if bucket is None:
+                bucket = self._instances[instance] = self._instance_bucket(instance)
+        wait = bucket.reserve()
+        self.wait.record(wait)
+        return wait
+
+    def _instance_bucket(self, instance: tuple[str, str]):
+        if self.store is None:
+            return TokenBucket(self.rate, self.burst)
+        url, token = instance
+        # Token DB mein nahi likhte, sirf uska hash
+        return SharedTokenBucket(self.store, f"{url}#{zlib.crc32(token.encode()):08x}", self.rate, self.burst)
+
+    def acquire(self, instance: tuple[str, str]):
+        wait = self.delay(instance)
+        if wait:
+            self.waiting += 1
+            time.sleep(wait)
+            self.waiting -= 1
+
+    async def acquire_async(self, instance: tuple[str, str]):
+        # Shared bucket ka reserve SQLite commit hai → event loop pe nahi
+        wait = await asyncio.to_thread(self.delay, instance)
+        if wait:
+            self.waiting += 1
+            await asyncio.sleep(wait)
+            self.waiting -= 1
+
+    def stats(self) -> dict:
+        return {
+            "rate_per_instance": self.rate,
+            "shared": self.store is not None,
+            "rate_per_phone": self.phone_rate,
+            "waiting": self.waiting,
+            "tracked_phones": len(self._phones),
+            "wait": self.wait.snapshot(),
+        }
+
+
+ULTRAMSG_RATE = float(os.getenv("ULTRAMSG_RATE", "10"))
+ULTRAMSG_BURST = float(os.getenv("ULTRAMSG_BURST", "20"))
+PHONE_RATE = float(os.getenv("PHONE_RATE", "0.2"))
+PHONE_BURST = float(os.getenv("PHONE_BURST", "3"))
+
+rate_limiter = SendRateLimiter(ULTRAMSG_RATE, ULTRAMSG_BURST, PHONE_RATE, PHONE_BURST, store=scheduler.store)
+
+
+# 🔌 Circuit Breaker: fail hote endpoint ko baar baar hit na karo
+class CircuitBreaker:
+    """
+    Closed until `failures` consecutive sends fail, then open: nothing is
+    sent for `reset_timeout` seconds. After that it is half-open and lets a
+    single probe through; its result closes or re-opens the circuit.
+    """
+
+    def __init__(self, failures: int = 5, reset_timeout: float = 30.0):
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self.consecutive = 0
+        self.opens = 0
+        self.opened_at: float | None = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return state == "closed"
+
+    def record(self, ok: bool):
+        with self._lock:
+            self._probing = False
+            if ok:
+                self.consecutive = 0
+                self.opened_at = None
+                return
+            self.consecutive += 1
+            if self.opened_at is None and self.consecutive >= self.failures:
+                self.opens += 1
+                print(f"⚠️ Circuit opened after {self.consecutive} failed sends")
+            if self.opened_at is not None or self.consecutive >= self.failures:
+                self.opened_at = time.monotonic()
+
+
+# ⚖️ UltraMsg Instance Pool: kai (url, token) senders mein load balancing
+class UltraMsgInstance:
+    def __init__(self, url: str, token: str, breaker: CircuitBreaker, window: int = 50):
+        self.url = url
+        self.token = token
+        self.breaker = breaker
+        self.outstanding = 0
+        self.sent = 0
+        self.errors = 0
+        self.ejected_until = 0.0
+        self.recent: deque[bool] = deque(maxlen=window)  # True = send failed
+
+    @property
+    def key(self) -> tuple[str, str]:
+        return (self.url, self.token)
+
+
+class InstancePool:
+    """
+    Picks an UltraMsg instance per send. A phone sticks to the instance it
+    was first given (so its chat stays on one sender number); new phones go
+    to the healthy instance with the fewest outstanding requests. An
+    instance whose recent error rate reaches `error_threshold` is ejected
+    for `eject_seconds`; one with an open circuit breaker is skipped too.
+    """
+
+    def __init__(self, instances: list[tuple[str, str]], error_threshold: float = 0.5, min_samples: int = 20,
+                 eject_seconds: float = 60.0, max_sticky: int = 100_000, breaker_failures: int = 5,
+                 breaker_reset: float = 30.0):
+        self.instances = [UltraMsgInstance(url, token, CircuitBreaker(breaker_failures, breaker_reset))
+                          for url, token in instances]
+        self.error_threshold = error_threshold
+        self.min_samples = min_samples
+        self.eject_seconds = eject_seconds
+        self.max_sticky = max_sticky
+        self._sticky: OrderedDict[str, UltraMsgInstance] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def pick(self, phone: str) -> UltraMsgInstance:
+        with self._lock:
+            now = time.monotonic()
+            # Sab eject ho gaye hon to bhi bhejte raho (reminder rokne se behtar)
+            healthy = [i for i in self.instances
+                       if i.ejected_until <= now and i.breaker.state != "open"] or self.instances
+            instance = self._sticky.get(phone)
+            if instance is None or instance not in healthy:
+                instance = min(healthy, key=lambda i: i.outstanding)
+                self._sticky[phone] = instance
+                while len(self._sticky) > self.max_sticky:
+                    self._sticky.popitem(last=False)
+            self._sticky.move_to_end(phone)
+            instance.outstanding += 1
+            return instance
+
+    def release(self, instance: UltraMsgInstance, ok: bool | None):
+        """
+        `ok=False` only for failures that say the instance is unhealthy
+        (network error, 429, 5xx); `ok=None`: the send was never attempted
+        (circuit open), so no health update.
+        """
+        with self._lock:
+            instance.outstanding -= 1
+            if ok is None:
+                return
+            instance.breaker.record(ok)
+            instance.sent += 1
+            instance.errors += not ok
+            instance.recent.append(not ok)
+            failures = sum(instance.recent)
+            if len(instance.recent) >= self.min_samples and failures / len(instance.recent) >= self.error_threshold:
+                instance.ejected_until = time.monotonic() + self.eject_seconds
+                instance.recent.clear()
+                print(f"⚠️ UltraMsg instance {instance.url} ejected for {self.eject_seconds:.0f}s")
+
+    def stats(self) -> list[dict]:
+        now = time.monotonic()
+        return [{
+            "url": i.url,
+            "outstanding": i.outstanding,
+            "sent": i.sent,
+            "errors": i.errors,
+            "ejected_for_s": round(max(0.0, i.ejected_until - now), 1),
+            "circuit": i.breaker.state,
+            "circuit_opens": i.breaker.opens,
+        } for i in self.instances]
+
+
+INSTANCE_ERROR_THRESHOLD = float(os.getenv("INSTANCE_ERROR_THRESHOLD", "0.5"))
+INSTANCE_EJECT_SECONDS = float(os.getenv("INSTANCE_EJECT_SECONDS", "60"))
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+
+instance_pool = InstancePool(ULTRAMSG_INSTANCES, error_threshold=INSTANCE_ERROR_THRESHOLD,
+                             eject_seconds=INSTANCE_EJECT_SECONDS, breaker_failures=BREAKER_FAILURES,
+                             breaker_reset=BREAKER_RESET_SECONDS)
+
+
+# 🔁 Retry Queue: fail hue sends backoff ke baad alag workers pe dobara
+@dataclass(eq=False)
+class SendJob:
+    """One reminder message on its way to UltraMsg, across all of its attempts."""
+    reminders: list[Reminder]
+    deadline: float  # is waqt ke baad reminder ka koi faida nahi
+    key: str | None = None  # outbox idempotency key
+    attempts: int = 0
+    error: str = ""
+    term: int = 0  # kis leadership term mein bana (purane term ke jobs bheje nahi jate)
+
+
+def retryable(result: dict) -> bool:
+    # Network error, 429 aur 5xx dobara try karne layak; baqi 4xx nahi
+    code = result.get("code")
+    return code is None or code == 429 or code >= 500
+
+
+class RetryQueue:
+    """
+    Holds failed sends until their backoff expires and re-sends them on its
+    own workers, so retries never take a slot from fresh due reminders.
+    Backoff is exponential with full jitter, capped at `max_delay`; a job is
+    dropped once `max_attempts` is reached or the next try would land past
+    its deadline.
+    """
+
+    def __init__(self, max_attempts: int = 5, base_delay: float = 2.0, max_delay: float = 60.0,
+                 workers: int = 2, max_size: int = 10_000):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.workers = workers
+        self.max_size = max_size
+        self.send = None  # deliver / deliver_async neeche set hote hain
+        self.send_async = None
+        self.retried = 0
+        self.deferred = 0  # phone rate limit ki wajah se baad mein (attempt nahi gina)
+        self.exhausted = 0
+        self.overflowed = 0
+        self._heap: list[tuple[float, int, SendJob]] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._async_pending = 0
+        self._tasks: set[asyncio.Task] = set()
+        self._started = False
+
+    def backoff(self, job: SendJob, result: dict) -> float | None:
+        """Delay before the next attempt, or None when the job should not be retried."""
+        if retryable(result) and job.attempts < self.max_attempts:
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (job.attempts - 1)))
+            if time.time() + delay <= job.deadline:
+                return delay
+        self.exhausted += 1
+        print(f"❌ Giving up on reminder for {job.reminders[0].phone} after {job.attempts} attempts: {job.error}")
+        return None
+
+    def _accept(self, deferred: bool) -> bool:
+        if len(self._heap) + self._async_pending >= self.max_size:
+            self.overflowed += 1
+            return False
+        if deferred:
+            self.deferred += 1
+        else:
+            self.retried += 1
+        return True
+
+    def push(self, job: SendJob, delay: float, deferred: bool = False) -> bool:
+        """Send `job` again after `delay`; `deferred` = not a failure, just waiting on its phone's rate limit."""
+        with self._cond:
+            if not self._accept(deferred):
+                return False
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), job))
+            self._cond.notify()
+            return True
+
+    def push_async(self, job: SendJob, delay: float, deferred: bool = False) -> bool:
+        if not self._accept(deferred):
+            return False
+        self._async_pending += 1
+        asyncio.get_running_loop().call_later(delay, self._spawn, job)
+        return True
+
+    def clear(self) -> int:
+        """Drop the waiting thread-mode retries (leadership lost); return how many."""
+        with self._cond:
+            dropped = len(self._heap)
+            self._heap.clear()
+            return dropped
+
+    def _spawn(self, job: SendJob):
+        self._async_pending -= 1
+        task = asyncio.get_running_loop().create_task(self.send_async(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+        for i in range(self.workers):
+            threading.Thread(target=self._worker, name=f"retry-{i}", daemon=True).start()
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    self._cond.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                _, _, job = heapq.heappop(self._heap)
+            try:
+                self.send(job)
+            except Exception as e:
+                print(f"❌ Retry error: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "waiting": len(self._heap) + self._async_pending,
+            "retried": self.retried,
+            "deferred": self.deferred,
+            "exhausted": self.exhausted,
+            "overflowed": self.overflowed,
+        }
+
+
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "5"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "2"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "60"))
+REMINDER_SEND_DEADLINE = float(os.getenv("REMINDER_SEND_DEADLINE", "900"))
+
+retry_queue = RetryQueue(RETRY_MAX_ATTEMPTS, RETRY_BASE_DELAY, RETRY_MAX_DELAY)
+
+
+# 📨 Due reminder ko WhatsApp pe bhejna
+def reminder_message(reminders: list[Reminder]) -> str:
+    first = reminders[0]
+    if len(reminders) == 1:
+        return f"💊 Reminder: It's time to take your medicine '{first.medicine}' at {first.t}"
+    medicines = "\n".join(f"• {reminder.medicine}" for reminder in reminders)
+    return f"💊 Reminder: It's time to take your medicines at {first.t}:\n{medicines}"
+
+
+# 📬 Outbox: due reminder pehle disk pe, phir dispatch → crash ke baad bhi send hota hai
+class Outbox:
+    """
+    At-least-once delivery for due reminders. Each due message is journaled
+    in the store's `outbox` table before it is dispatched and settled once
+    UltraMsg answers 200 (or its retries run out). Rows still pending at
+    startup are replayed.
+
+    The idempotency key is derived from the phone, the due time and the
+    medicines, so a reminder that fires again after a crash (before its
+    next fire time was saved) finds its row and is not sent twice. The key
+    is also passed to UltraMsg as `referenceId`.
+
+    The store runs SQLite in WAL mode with synchronous=NORMAL: a journal
+    write survives a process crash without an fsync per message.
+
+    Jobs carry the leadership `term` they were created in. `new_term()` is
+    called whenever this process starts or stops leading, so jobs still
+    queued from an earlier term are dropped unsent; their rows stay pending
+    for whichever process leads next.
+    """
+
+    PRUNE_EVERY = 1000
+
+    def __init__(self, store: ReminderStore, deadline: float, keep_sent: float = 86400.0):
+        self.store = store
+        self.deadline = deadline
+        self.keep_sent = keep_sent
+        self.journaled = 0
+        self.duplicates = 0
+        self.sent = 0
+        self.failed = 0
+        self.replayed = 0
+        self.dropped = 0
+        self.term = 0
+
+    def new_term(self):
+        self.term += 1
+
+    def current(self, job: SendJob) -> bool:
+        """False (and counted) if `job` belongs to an earlier leadership term."""
+        if job.term == self.term:
+            return True
+        self.dropped += 1
+        return False
+
+    @staticmethod
+    def key_for(reminders: list[Reminder]) -> str:
+        first = reminders[0]
+        medicines = ",".join(sorted(r.medicine for r in reminders))
+        return uuid.uuid5(uuid.NAMESPACE_OID, f"{first.phone}|{first.next_fire_at:.0f}|{medicines}").hex
+
+    def record(self, reminders: list[Reminder]) -> SendJob | None:
+        """Journal one due batch; None if this exact message was journaled already."""
+        jobs = self.record_many([reminders])
+        return jobs[0] if jobs else None
+
+    def record_many(self, batches: list[list[Reminder]]) -> list[SendJob]:
+        """Journal a tick's due batches together; return jobs for the ones not journaled before."""
+        messages = [(self.key_for(reminders), reminders) for reminders in batches]
+        new = self.store.journal(messages)
+        jobs = []
+        for key, reminders in messages:
+            if key in new:
+                new.discard(key)  # ek hi tick mein wahi message do dafa → ek job
+                jobs.append(SendJob(reminders, deadline=reminders[0].next_fire_at + self.deadline, key=key,
+                                    term=self.term))
+        self.journaled += len(jobs)
+        self.duplicates += len(messages) - len(jobs)
+        return jobs
+
+    def done(self, job: SendJob):
+        if job.key is None:
+            return
+        self.store.settle(job.key, "sent", job.attempts)
+        self.sent += 1
+        if self.sent % self.PRUNE_EVERY == 0:
+            self.store.prune_outbox(time.time() - self.keep_sent)
+
+    def give_up(self, job: SendJob):
+        self.failed += 1
+        if job.key is not None:
+            self.store.settle(job.key, "failed", job.attempts, job.error)
+
+    def replay(self, shard: int | None = None) -> list[SendJob]:
+        """Pending rows left by a crashed leader, as jobs to dispatch again (expired ones are failed)."""
+        self.store.prune_outbox(time.time() - self.keep_sent)
+        jobs = []
+        for key, phone, medicines, t, t_24, due_at in self.store.unsent(shard):
+            reminders = [Reminder(phone=phone, medicine=medicine, t=t, t_24=t_24, next_fire_at=due_at)
+                         for medicine in json.loads(medicines)]
+            job = SendJob(reminders, deadline=due_at + self.deadline, key=key, error="❌ Error: expired before replay",
+                          term=self.term)
+            if job.deadline < time.time():
+                self.give_up(job)
+                continue
+            jobs.append(job)
+        self.replayed += len(jobs)
+        if jobs:
+            print(f"📬 Replaying {len(jobs)} unsent reminder(s) from the outbox")
+        return jobs
+
+    def revive(self, limit: int) -> list[SendJob]:
+        """Take up to `limit` dead letters back into the outbox as fresh jobs (new deadline, attempts reset)."""
+        now = time.time()
+        return [SendJob([Reminder(phone=phone, medicine=medicine, t=t, t_24=t_24, next_fire_at=now)
+                         for medicine in json.loads(medicines)], deadline=now + self.deadline, key=key,
+                        term=self.term)
+                for key, phone, medicines, t, t_24 in self.store.claim_dead_letters(limit)]
+
+    def stats(self) -> dict:
+        return {
+            "journaled": self.journaled,
+            "duplicates": self.duplicates,
+            "sent": self.sent,
+            "failed": self.failed,
+            "replayed": self.replayed,
+            "dropped": self.dropped,
+        }
+
+
+outbox = Outbox(scheduler.store, deadline=REMINDER_SEND_DEADLINE)
+
+
+def journaled(submit):
+    """Wrap a dispatcher's `submit` so a tick's due batches are written to the outbox before they are sent."""
+    def fire(batches: list[list[Reminder]]):
+        for job in outbox.record_many(batches):
+            submit(job)
+    return fire
+
+
+CIRCUIT_OPEN = {"status": "❌ Error: circuit open", "code": None}
+PHONE_LIMITED = "❌ Error: per-phone rate limit until past the deadline"
+
+
+def phone_wait(job: SendJob) -> float:
+    """0.0 if `job` may be sent now, else the wait for its phone's rate limit (past the deadline → inf)."""
+    wait = rate_limiter.phone_delay(job.reminders[0].phone)
+    if wait and time.time() + wait > job.deadline:
+        job.error = PHONE_LIMITED
+        return math.inf
+    return wait
+
+
+def deliver(job: SendJob):
+    if not outbox.current(job):
+        # Leadership chali gayi: row outbox mein pending hai, naya leader bhejega
+        return
+    wait = phone_wait(job)
+    if wait:
+        # Worker ko sulane ke bajaye retry heap pe: ek patient ke messages baqi sends nahi rokte
+        if wait == math.inf or not retry_queue.push(job, wait, deferred=True):
+            outbox.give_up(job)
+        return
+    phone = job.reminders[0].phone
+    instance = instance_pool.pick(phone)
+    result, attempted = CIRCUIT_OPEN, False
+    try:
+        if instance.breaker.allow():
+            # Circuit open ho to attempt count nahi hota, sirf deadline tak wait
+            attempted = True
+            job.attempts += 1
+            rate_limiter.acquire(instance.key)
+            result = post_whatsapp(phone, reminder_message(job.reminders), instance.url, instance.token,
+                                   reference_id=job.key)
+    finally:
+        # 4xx (e.g. galat number) instance ki kharabi nahi → breaker / ejection mein failure nahi
+        instance_pool.release(instance, not retryable(result) if attempted else None)
+    if result.get("code") == 200:
+        outbox.done(job)
+        return
+    job.error = result["status"]
+    delay = retry_queue.backoff(job, result)
+    if delay is None or not retry_queue.push(job, delay):
+        outbox.give_up(job)
+
+
+# 🧵 Dispatch Pool: scheduler sirf queue mein daalta hai, workers HTTP send karte hain
+class DispatchPool:
+    """
+    Bounded queue plus a fixed pool of worker threads. The scheduler thread
+    only enqueues due reminders, so one slow WhatsApp call never delays the
+    reminders behind it. A full queue blocks the producer (backpressure).
+    """
+
+    def __init__(self, send, workers: int = 8, max_queue: int = 10_000):
+        self.send = send
+        self.workers = workers
+        self.queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self.latency = LatencyStats()
+        self.errors = 0
+        self._started = False
+
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+        for i in range(self.workers):
+            threading.Thread(target=self._worker, name=f"dispatch-{i}", daemon=True).start()
+
+    def submit(self, item):
+        self.queue.put(item)
+
+    def clear(self) -> int:
+        """Drop everything still queued (leadership lost); return how many."""
+        dropped = 0
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                return dropped
+            self.queue.task_done()
+            dropped += 1
+
+    def _worker(self):
+        while True:
+            item = self.queue.get()
+            start = time.perf_counter()
+            try:
+                self.send(item)
+            except Exception as e:
+                self.errors += 1
+                print(f"❌ Dispatch error: {e}")
+            finally:
+                self.latency.record(time.perf_counter() - start)
+                self.queue.task_done()
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queue_depth": self.queue.qsize(),
+            "queue_capacity": self.queue.maxsize,
+            "errors": self.errors,
+            "send_latency": self.latency.snapshot(),
+        }
+
+
+DISPATCH_WORKERS = int(os.getenv("DISPATCH_WORKERS", "8"))
+DISPATCH_QUEUE_SIZE = int(os.getenv("DISPATCH_QUEUE_SIZE", "10000"))
+
+dispatcher = DispatchPool(deliver, workers=DISPATCH_WORKERS, max_queue=DISPATCH_QUEUE_SIZE)
+
+
+# ⚡ Async Dispatcher: event loop pe sends, semaphore se in-flight limit
+class AsyncDispatcher:
+    """
+    Sends due reminders as tasks on the app's event loop. A semaphore caps
+    the number of in-flight HTTP requests, so thousands of concurrent sends
+    need no extra threads.
+    """
+
+    def __init__(self, send, max_in_flight: int = 500):
+        self.send = send
+        self.max_in_flight = max_in_flight
+        self.latency = LatencyStats()
+        self.errors = 0
+        self.pending = 0
+        self.in_flight = 0
+        self._sem: asyncio.Semaphore | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    def submit(self, item):
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.max_in_flight)
+        self.pending += 1
+        task = asyncio.get_running_loop().create_task(self._run(item))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, item):
+        async with self._sem:
+            self.pending -= 1
+            self.in_flight += 1
+            start = time.perf_counter()
+            try:
+                await self.send(item)
+            except Exception as e:
+                self.errors += 1
+                print(f"❌ Dispatch error: {e}")
+            finally:
+                self.in_flight -= 1
+                self.latency.record(time.perf_counter() - start)
+
+    def stats(self) -> dict:
+        return {
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "queue_depth": self.pending,
+            "errors": self.errors,
+            "send_latency": self.latency.snapshot(),
+        }
+
+
+async def deliver_async(job: SendJob):
+    if not outbox.current(job):
+        return
+    wait = phone_wait(job)
+    if wait:
+        if wait == math.inf or not retry_queue.push_async(job, wait, deferred=True):
+            await asyncio.to_thread(outbox.give_up, job)
+        return
+    phone = job.reminders[0].phone
+    instance = instance_pool.pick(phone)
+    result, attempted = CIRCUIT_OPEN, False
+    try:
+        if instance.breaker.allow():
+            # Circuit open ho to attempt count nahi hota, sirf deadline tak wait
+            attempted = True
+            job.attempts += 1
+            await rate_limiter.acquire_async(instance.key)
+            result = await post_whatsapp_async(phone, reminder_message(job.reminders), instance.url, instance.token,
+                                               reference_id=job.key)
+    finally:
+        instance_pool.release(instance, not retryable(result) if attempted else None)
+    # Outbox settle SQLite write hai → worker thread pe
+    if result.get("code") == 200:
+        await asyncio.to_thread(outbox.done, job)
+        return
+    job.error = result["status"]
+    delay = retry_queue.backoff(job, result)
+    if delay is None or not retry_queue.push_async(job, delay):
+        await asyncio.to_thread(outbox.give_up, job)
+
+
+retry_queue.send, retry_queue.send_async = deliver, deliver_async
+
+
+DISPATCH_MODE = os.getenv("DISPATCH_MODE", "thread")
+if DISPATCH_MODE not in ("thread", "async"):
+    raise ValueError(f"❌ Unknown DISPATCH_MODE: {DISPATCH_MODE}")
+
+async_dispatcher = AsyncDispatcher(deliver_async, max_in_flight=ASYNC_MAX_IN_FLIGHT)
+
+
+# ☠️ Dead Letters: retries khatam hone wale reminders (outbox mein 'failed'), outage ke baad replay
+class DeadLetterReplay:
+    """
+    Drains the dead-letter queue back through the normal send path in
+    batches of `batch_size`, pausing between batches so no more than `rate`
+    messages per second are queued. One replay runs at a time per process;
+    rows are claimed in the store first, so replays in other workers never
+    pick the same row.
+    """
+
+    def __init__(self, rate: float = 20.0):
+        self.rate = rate
+        self.running = False
+        self.replayed = 0
+        self._lock = threading.Lock()
+
+    def start(self, limit: int | None, batch_size: int) -> bool:
+        with self._lock:
+            if self.running:
+                return False
+            self.running = True
+        if DISPATCH_MODE == "thread":
+            # Non-leader worker mein bhi replay chal sakta hai, is liye workers yahan start
+            dispatcher.start()
+            retry_queue.start()
+        threading.Thread(target=self._run, args=(limit, batch_size), name="dlq-replay", daemon=True).start()
+        return True
+
+    def _run(self, limit: int | None, batch_size: int):
+        remaining = limit if limit is not None else math.inf
+        try:
+            while remaining > 0:
+                jobs = outbox.revive(int(min(batch_size, remaining)))
+                if not jobs:
+                    break
+                for job in jobs:
+                    if DISPATCH_MODE == "async":
+                        app.state.loop.call_soon_threadsafe(async_dispatcher.submit, job)
+                    else:
+                        dispatcher.submit(job)
+                self.replayed += len(jobs)
+                remaining -= len(jobs)
+                print(f"🔁 Replayed {len(jobs)} dead letter(s)")
+                time.sleep(len(jobs) / self.rate)
+        except Exception as e:
+            print(f"❌ Dead letter replay error: {e}")
+        finally:
+            self.running = False
+
+    def stats(self) -> dict:
+        return {"running": self.running, "replayed": self.replayed, "rate": self.rate}
+
+
+DLQ_REPLAY_RATE = float(os.getenv("DLQ_REPLAY_RATE", "20"))
+
+dlq_replay = DeadLetterReplay(rate=DLQ_REPLAY_RATE)
+
+
+# 🗓 Reminders schedule karna (tool aur fast path dono yahi use karte hain)
+def add_reminders(phone: str, medicine: str, times: list[str]) -> str:
+    reminders = []
+    for t in times:
+        t_24 = to_24h(t)
+        # Pehle saare times validate, taake galat time pe aadhe reminders na ban jayen
+        reminders.append(Reminder(phone=phone, medicine=medicine, t=t, t_24=t_24,
+                                  next_fire_at=next_fire_at(t_24)))
+
+    # Add reminders in scheduler (same phone + medicine + time dobara aaye to no-op)
+    for reminder in reminders:
+        if scheduler.add(reminder):
+            print(f"⏰ Reminder scheduled at {reminder.t_24} (original: {reminder.t})")
+        else:
+            print(f"♻️ Reminder already scheduled at {reminder.t_24} (original: {reminder.t})")
 
     return f"✅ Reminders for {medicine} scheduled at {times} for {phone}"
 
 
+# 🛠 Tool: Schedule Reminder
+@function_tool
+def schedule_reminder(phone: str, medicine: str, times: list[str]):
+    """
+    Schedule WhatsApp reminders for given medicine at specified times.
+    """
+    return add_reminders(phone, medicine, times)
+
+
 # ✅ Global Scheduler Thread (sirf ek hi dafa chalega)
+# Har second poll karne ke bajaye agle deadline tak sota hai
 def run_schedule():
-    while True:
-        schedule.run_pending()
-        time.sleep(1)
+    scheduler.run(journaled(dispatcher.submit))
+
+
+def report_crash(future):
+    # run_async ka exception future mein band reh jata → yahan log
+    if not future.cancelled() and future.exception() is not None:
+        print(f"❌ Scheduler loop crashed: {future.exception()}")
 
 # Ek hi thread start karna (duplicate threads avoid karne ke liye)
 # threading.Thread(target=run_schedule, daemon=True).start()
 
+
+# 👑 Leader Election: `uvicorn --workers N` mein sirf ek process reminders fire kare
+class LeaderElection:
+    """
+    Holds a named lease row in the shared SQLite store. Every process tries
+    to take or renew it every `ttl / 3` seconds; whoever holds it runs the
+    scheduler (`on_elected`), and a process that loses it stops
+    (`on_demoted`). A crashed leader's lease simply expires after `ttl`.
+
+    The callbacks run in order on their own thread, so slow start-up work
+    (outbox replay, rebalancing) never delays a lease renewal. A leader
+    whose `healthy()` check fails gives the lease up instead of renewing it.
+    """
+
+    def __init__(self, store: ReminderStore, on_elected, on_demoted, name: str = "scheduler", ttl: float = 15.0,
+                 healthy=None):
+        self.store = store
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.healthy = healthy
+        self.name = name
+        self.ttl = ttl
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.is_leader = False
+        self._stopped = threading.Event()
+        self._transitions: queue.Queue = queue.Queue()
+
+    def start(self):
+        threading.Thread(target=self._run, name=f"lease-{self.name}", daemon=True).start()
+        threading.Thread(target=self._apply, name=f"lease-{self.name}-callbacks", daemon=True).start()
+
+    def _apply(self):
+        while True:
+            callback = self._transitions.get()
+            try:
+                callback()
+            except Exception as e:
+                print(f"❌ Leadership callback error: {e}")
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                held = self.store.acquire_lease(self.name, self.owner, self.ttl)
+            except sqlite3.Error as e:
+                print(f"❌ Lease error: {e}")
+                held = False
+            if held and self.is_leader and self.healthy is not None and not self.healthy():
+                # Lease renew ho rahi magar scheduler loop mar gaya / atka → chhodo, doosra worker le le
+                print(f"⚠️ {self.owner} scheduler stalled, releasing the {self.name} lease")
+                try:
+                    self.store.release_lease(self.name, self.owner)
+                except sqlite3.Error as e:
+                    print(f"❌ Lease error: {e}")
+                held = False
+            if held and not self.is_leader:
+                self.is_leader = True
+                print(f"👑 {self.owner} is now the {self.name} leader")
+                self._transitions.put(self.on_elected)
+            elif not held and self.is_leader:
+                self.is_leader = False
+                print(f"⚠️ {self.owner} lost the {self.name} lease")
+                self._transitions.put(self.on_demoted)
+            self._stopped.wait(self.ttl / 3)
+
+    def stop(self):
+        self._stopped.set()
+        if self.is_leader:
+            self.is_leader = False
+            self.on_demoted()
+            self.store.release_lease(self.name, self.owner)
+
+
+LEADER_ELECTION = os.getenv("LEADER_ELECTION", "1") == "1"
+LEADER_LEASE_TTL = float(os.getenv("LEADER_LEASE_TTL", "15"))
+
+
+def feed(jobs: list[SendJob]):
+    # Replay apne thread pe: queue bhari ho to bhi scheduler start hone ka intezar nahi karta
+    for job in jobs:
+        if not outbox.current(job):
+            return
+        dispatcher.submit(job)
+
+
+def start_scheduling():
+    outbox.new_term()
+    # Pichle leader ke crash se reh gaye (journaled magar unsent) reminders pehle
+    unsent = outbox.replay(scheduler.shard)
+    if DISPATCH_MODE == "async":
+        # Async mode: scheduler aur sends dono app ke event loop pe
+        # run_async fire ko worker thread se bulata hai → submit wapas loop pe
+        submit = lambda job: app.state.loop.call_soon_threadsafe(async_dispatcher.submit, job)
+        for job in unsent:
+            submit(job)
+        future = asyncio.run_coroutine_threadsafe(scheduler.run_async(journaled(submit)), app.state.loop)
+        future.add_done_callback(report_crash)
+    else:
+        dispatcher.start()
+        retry_queue.start()
+        threading.Thread(target=feed, args=(unsent,), name="outbox-replay", daemon=True).start()
+        threading.Thread(target=run_schedule, daemon=True).start()
+    print(f"✅ Scheduler started successfully! (dispatch: {DISPATCH_MODE}, shard: {scheduler.shard})")
+
+
+# 🧩 Sharded Scheduler: N processes, har ek `crc32(phone) % N` wale reminders fire karta hai
+def run_shard(shard: int, shards: int, parent_pid: int):
+    """Entry point of one shard process (started by ShardSupervisor with the spawn method)."""
+    global async_http
+    scheduler.shard = shard
+    app.state.loop = asyncio.new_event_loop()
+    threading.Thread(target=app.state.loop.run_forever, daemon=True).start()
+    if DISPATCH_MODE == "async":
+        async_http = make_async_http_client()
+
+    # Shard ka apna lease: purana (orphan) shard process abhi zinda ho to wait karo
+    lease = LeaderElection(scheduler.store, on_elected=start_scheduling, on_demoted=stop_leading,
+                           name=f"shard-{shard}/{shards}", ttl=LEADER_LEASE_TTL, healthy=scheduler.alive)
+    lease.start()
+    # Supervisor (parent) mar gaya → hum bhi band, naya leader naye shards chalayega
+    while os.getppid() == parent_pid:
+        time.sleep(1)
+    lease.stop()
+
+
+class ShardSupervisor:
+    """Keeps `shards` shard processes alive while this process is the scheduler leader."""
+
+    def __init__(self, shards: int):
+        self.shards = shards
+        self.processes: dict[int, multiprocessing.Process] = {}
+        self._stopped = threading.Event()
+
+    def start(self):
+        self._stopped.clear()
+        threading.Thread(target=self._run, name="shard-supervisor", daemon=True).start()
+
+    def _run(self):
+        ctx = multiprocessing.get_context("spawn")
+        while not self._stopped.is_set():
+            for shard in range(self.shards):
+                process = self.processes.get(shard)
+                if process is not None and process.is_alive():
+                    continue
+                if process is not None:
+                    print(f"⚠️ Shard {shard} exited (code {process.exitcode}), restarting")
+                process = ctx.Process(target=run_shard, args=(shard, self.shards, os.getpid()),
+                                      name=f"shard-{shard}", daemon=True)
+                process.start()
+                self.processes[shard] = process
+            self._stopped.wait(5)
+
+    def stop(self):
+        self._stopped.set()
+        for process in self.processes.values():
+            process.terminate()
+        self.processes.clear()
+
+
+shard_supervisor = ShardSupervisor(SCHEDULER_SHARDS)
+
+
+def start_leading():
+    # Shard count badla ho to rows naye shards mein baant do
+    scheduler.store.rebalance()
+    if SCHEDULER_SHARDS > 1:
+        shard_supervisor.start()
+    else:
+        start_scheduling()
+
+
+def stop_leading():
+    scheduler.stop()
+    shard_supervisor.stop()
+    # Queue mein pade sends ab is process ke nahi: outbox mein pending rehte hain, naya leader replay karega
+    outbox.new_term()
+    dropped = dispatcher.clear() + retry_queue.clear()
+    if dropped:
+        print(f"🛑 Dropped {dropped} queued send(s) after losing leadership")
+
+
+election = LeaderElection(scheduler.store, on_elected=start_leading, on_demoted=stop_leading,
+                          ttl=LEADER_LEASE_TTL, healthy=scheduler.alive)
+
+
 # 🚀 Scheduler ko FastAPI ke startup ke sath bind karna
 @app.on_event("startup")
-def start_scheduler():
-    threading.Thread(target=run_schedule, daemon=True).start()
-    print("✅ Scheduler started successfully!")
+async def start_scheduler():
+    global async_http
+    app.state.loop = asyncio.get_running_loop()
+    if DISPATCH_MODE == "async":
+        async_http = make_async_http_client()
+    if LEADER_ELECTION or SCHEDULER_SHARDS > 1:
+        # Baqi workers sirf API serve karte hain aur naye reminders store ke through leader ko dete hain
+        election.start()
+    else:
+        # Rebalance / outbox replay store I/O hai → loop ke bahar
+        await asyncio.to_thread(start_leading)
+
+
+@app.on_event("shutdown")
+async def stop_scheduler():
+    if LEADER_ELECTION or SCHEDULER_SHARDS > 1:
+        election.stop()
+    if async_http is not None:
+        await async_http.aclose()
+
+
+# 📊 Scheduler / dispatch metrics
+@app.get("/metrics")
+def metrics():
+    active = async_dispatcher if DISPATCH_MODE == "async" else dispatcher
+    return {"scheduler": {**scheduler.stats(), "pid": os.getpid()}, "dispatch": active.stats(), "http": http_stats(),
+            "rate_limit": rate_limiter.stats(), "instances": instance_pool.stats(),
+            "retry": retry_queue.stats(), "outbox": outbox.stats(),
+            "dlq": {**dlq_replay.stats(), "size": scheduler.store.count_dead_letters()},
+            "agent": agent_admission.stats(), "agent_cache": agent_cache.stats(), "leases": scheduler.store.leases()}
+
+
+
+
+# 🧪 Mock LLM: offline benchmark ke liye, Gemini ki jagah deterministic jawab
+class MockReminderModel(Model):
+    """
+    Local stand-in for the Gemini model. The first turn pulls the phone,
+    medicine and dose times out of the user text with regexes and returns a
+    `schedule_reminder` tool call; once the tool output is in the input it
+    returns that output as the final text. Each call sleeps `latency`
+    seconds to mimic model time.
+    """
 
+    PHONE = re.compile(r"\+?\d[\d -]{5,}\d")  # 7+ digits (short test / local numbers bhi)
+    TIME = re.compile(r"\b\d{1,2}:\d{2}(?::\d{2})?(?:\s?[AaPp][Mm])?|\b\d{1,2}\s?[AaPp][Mm]\b")
+    MEDICINE = re.compile(r"Medicine Name:\s*(.+)|\btake\s+([A-Za-z][\w-]*)", re.IGNORECASE)
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+
+    def parse(self, text: str) -> dict:
+        phone = self.PHONE.search(text)
+        medicine = self.MEDICINE.search(text)
+        times = []
+        for t in self.TIME.findall(text):
+            t = t.upper()
+            if ":" not in t:  # "9 AM" → "09:00 AM"
+                t = f"{int(t[:-2]):02d}:00 {t[-2:]}"
+            elif t[-1] == "M" and t[-3] != " ":
+                t = f"{t[:-2]} {t[-2:]}"
+            times.append(t)
+        return {
+            "phone": re.sub(r"[ -]", "", phone.group()) if phone else "",
+            "medicine": (medicine.group(1) or medicine.group(2)).strip() if medicine else "medicine",
+            "times": times,
+        }
+
+    async def get_response(self, system_instructions, input, model_settings, tools, output_schema, handoffs,
+                           tracing, **kwargs) -> ModelResponse:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        items = [{"role": "user", "content": input}] if isinstance(input, str) else input
+        tool_outputs = [item for item in items if item.get("type") == "function_call_output"]
+        if tool_outputs:
+            output = self.message(str(tool_outputs[-1]["output"]))
+        else:
+            user_text = "\n".join(str(item.get("content", "")) for item in items if item.get("role") == "user")
+            arguments = self.parse(user_text)
+            if not arguments["phone"]:
+                # Phone ke baghair tool call nahi (warna "" pe reminder ban jata)
+                return ModelResponse(output=[self.message("❌ Please include the phone number for the reminder.")],
+                                     usage=Usage(), response_id=None)
+            output = ResponseFunctionToolCall(
+                id=f"fc_{self.calls}", type="function_call", name="schedule_reminder", status="completed",
+                # Same input → same call_id (deterministic runs)
+                call_id=f"call_{zlib.crc32(json.dumps(arguments, sort_keys=True).encode()):08x}",
+                arguments=json.dumps(arguments),
+            )
+        return ModelResponse(output=[output], usage=Usage(), response_id=None)
+
+    def message(self, text: str) -> ResponseOutputMessage:
+        return ResponseOutputMessage(
+            id=f"msg_{self.calls}", type="message", role="assistant", status="completed",
+            content=[ResponseOutputText(type="output_text", text=text, annotations=[])],
+        )
 
+    async def stream_response(self, system_instructions, input, model_settings, tools, output_schema, handoffs,
+                              tracing, **kwargs):
+        # Streaming nahi: poora jawab ek hi "response.completed" event mein
+        response = await self.get_response(system_instructions, input, model_settings, tools, output_schema,
+                                           handoffs, tracing, **kwargs)
+        yield ResponseCompletedEvent(
+            type="response.completed", sequence_number=0,
+            response=Response(id=f"resp_{self.calls}", created_at=time.time(), model="mock", object="response",
+                              output=response.output, parallel_tool_calls=False, tool_choice="auto", tools=[]),
+        )
 
 
+MOCK_LLM_LATENCY_MS = float(os.getenv("MOCK_LLM_LATENCY_MS", "0"))
+
 # 🔗 External Client (Gemini)
 external_client = AsyncOpenAI(
-    api_key=OPENAI_API_KEY,
+    api_key=OPENAI_API_KEY or "mock",  # mock mode mein key nahi hoti, client phir bhi banta hai
     base_url="https://generativelanguage.googleapis.com/v1beta/openai/"
 )
 
-model = OpenAIChatCompletionsModel(
-    model="gemini-2.0-flash",
-    openai_client=external_client
-)
+if LLM_PROVIDER == "gemini":
+    model = OpenAIChatCompletionsModel(
+        model="gemini-2.0-flash",
+        openai_client=external_client
+    )
+elif LLM_PROVIDER == "mock":
+    model = MockReminderModel(latency=MOCK_LLM_LATENCY_MS / 1000)
+else:
+    raise ValueError(f"❌ Unknown LLM_PROVIDER: {LLM_PROVIDER}")
 
 config = RunConfig(
     model=model,
     model_provider=external_client,
-    tracing_disabled=False
+    # Mock mode mein traces bhi upload nahi hote (poora run offline)
+    tracing_disabled=LLM_PROVIDER == "mock"
 )
 
 # 🤖 Agent
@@ -148,18 +2382,463 @@ agent = Agent(
 )
 
 
-# 🚀 FastAPI Endpoint
-@app.post("/reminder")
-async def create_reminder(details: ReminderInput):
+# ⚡ Structured input pe LLM skip karna (fields already validated hain)
+REMINDER_FAST_PATH = os.getenv("REMINDER_FAST_PATH", "1") == "1"
+
+
+# 📥 Free-text Input Schema (sirf yahan agent/LLM chahiye)
+class ReminderText(BaseModel):
+    text: str   # e.g. "Remind me to take Panadol at 9 AM and 9 PM on +92300..."
+    source: Literal["clinic", "caregiver", "self"] = "self"
+
+
+# 🚦 Agent Admission: Gemini pe concurrency limit + priority wait queue
+class AgentAdmission:
+    """
+    Caps concurrent agent runs. Extra requests wait in a bounded priority
+    queue (clinic before caregiver before self-serve, FIFO within a class);
+    when that queue is full they are rejected straight away with 503.
+    """
+
+    PRIORITIES = {"clinic": 0, "caregiver": 1, "self": 2}
+
+    def __init__(self, max_concurrency: int = 8, max_waiting: int = 100):
+        self.max_concurrency = max_concurrency
+        self.max_waiting = max_waiting
+        self.active = 0
+        self.rejected = 0
+        self.queue_time = LatencyStats()
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+
+    async def acquire(self, source: str = "self"):
+        start = time.perf_counter()
+        if self.active < self.max_concurrency and not self._waiters:
+            self.active += 1
+            self.queue_time.record(0.0)
+            return
+        if len(self._waiters) >= self.max_waiting:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="❌ Reminder assistant is busy, try again later")
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (self.PRIORITIES.get(source, 2), next(self._seq), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Slot mil chuka tha lekin request cancel ho gayi → slot wapas
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        self.queue_time.record(time.perf_counter() - start)
+
+    def release(self):
+        # Slot seedha agle waiting request ko transfer (active count same rehta hai)
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self, source: str = "self"):
+        await self.acquire(source)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "active": self.active,
+            "waiting": len(self._waiters),
+            "max_waiting": self.max_waiting,
+            "rejected": self.rejected,
+            "queue_time": self.queue_time.snapshot(),
+        }
+
+
+AGENT_MAX_CONCURRENCY = int(os.getenv("AGENT_MAX_CONCURRENCY", "8"))
+AGENT_MAX_WAITING = int(os.getenv("AGENT_MAX_WAITING", "100"))
+
+agent_admission = AgentAdmission(max_concurrency=AGENT_MAX_CONCURRENCY, max_waiting=AGENT_MAX_WAITING)
+
+
+async def run_agent(user_input: str, source: str = "self"):
+    async with agent_admission.slot(source):
+        result = await Runner.run(agent, user_input, run_config=config)
+    print(f"""response: {result.final_output}, status: Reminders scheduled ✔ """)
+    return {"response": result.final_output, "status": "Reminders scheduled ✔ "}
+
+
+# 🧠 Agent Result Cache: normalized input → pichla agent result (LRU + TTL)
+class AgentResultCache:
+    """
+    LRU cache with a per-entry TTL. Identical requests that arrive while the
+    first one is still running share its result instead of starting a
+    second agent run. Keys start with the phone number; `invalidate(phone)`
+    drops every entry for that patient once their reminders change.
+    """
+
+    def __init__(self, max_size: int = 10_000, ttl: float = 600.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[tuple, tuple[float, dict]] = OrderedDict()
+        self._in_flight: dict[tuple, asyncio.Future] = {}
+        self._by_phone: dict[str, set[tuple]] = {}
+        self._stale: set[tuple] = set()  # invalidate() ke waqt chal rahe runs, inka result cache nahi hota
+
+    def get(self, key: tuple) -> dict | None:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self._discard(key)
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def put(self, key: tuple, value: dict):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        self._by_phone.setdefault(key[0], set()).add(key)
+        while len(self._data) > self.max_size:
+            self._discard(next(iter(self._data)))
+
+    def _discard(self, key: tuple):
+        self._data.pop(key, None)
+        keys = self._by_phone.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_phone[key[0]]
+
+    def invalidate(self, phone: str) -> int:
+        """Drop every cached result for `phone` (after a cancel / update); return how many."""
+        phone = phone.strip()
+        self._stale.update(key for key in self._in_flight if key[0] == phone)
+        keys = self._by_phone.pop(phone, set())
+        for key in keys:
+            self._data.pop(key, None)
+        return len(keys)
+
+    async def get_or_run(self, key: tuple, run, fresh=None):
+        """`fresh(key)` (optional) must confirm a cached result still holds before it is served."""
+        value = self.get(key)
+        if value is not None and fresh is not None and not await asyncio.to_thread(fresh, key):
+            self._discard(key)
+            value = None
+        if value is not None:
+            self.hits += 1
+            return value
+        if key in self._in_flight:
+            self.hits += 1
+            return await asyncio.shield(self._in_flight[key])
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            value = await run()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # koi aur wait na kar raha ho to "never retrieved" warning na aaye
+            raise
+        else:
+            if key in self._stale:
+                self._stale.discard(key)
+            else:
+                self.put(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            del self._in_flight[key]
+            self._stale.discard(key)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "ttl_s": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+def reminder_cache_key(details: ReminderInput) -> tuple:
+    return (
+        details.phone.strip(),
+        details.medicine_name.strip().casefold(),
+        tuple(sorted(to_24h(t) for t in details.dose_times)),
+    )
+
+
+def still_scheduled(key: tuple) -> bool:
+    # Cache hit tabhi jab store mein ye reminders abhi bhi hon (doosre worker ne cancel kiye hon to bhi)
+    phone, medicine, times = key
+    scheduled = {(r.medicine.strip().casefold(), r.t_24) for r in scheduler.find(phone)}
+    return all((medicine, t_24) in scheduled for t_24 in times)
+
+
+AGENT_CACHE_SIZE = int(os.getenv("AGENT_CACHE_SIZE", "10000"))
+AGENT_CACHE_TTL = float(os.getenv("AGENT_CACHE_TTL", "600"))
+
+agent_cache = AgentResultCache(max_size=AGENT_CACHE_SIZE, ttl=AGENT_CACHE_TTL)
+
+
+async def handle_reminder(details: ReminderInput):
+    if REMINDER_FAST_PATH:
+        # Direct scheduling: koi model call nahi, milliseconds mein jawab (store write loop ke bahar)
+        try:
+            output = await asyncio.to_thread(add_reminders, details.phone, details.medicine_name, details.dose_times)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=f"❌ Invalid dose time: {e}")
+        return {"response": output, "status": "Reminders scheduled ✔ "}
+
     user_input = f"""
     I need a reminder for my medicine.
     Medicine Name: {details.medicine_name}
     Dose Times: {details.dose_times}
     Phone Number: {details.phone}
     """
-    result = await Runner.run(agent, user_input, run_config=config)
-    print(f"""response: {result.final_output}, status: Reminders scheduled ✔ """)
-    return {"response": result.final_output, "status": "Reminders scheduled ✔ "}
+    try:
+        key = reminder_cache_key(details)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"❌ Invalid dose time: {e}")
+    # Retry / double-click pe same input → pichla final_output, dobara model call nahi
+    return await agent_cache.get_or_run(key, lambda: run_agent(user_input, details.source), fresh=still_scheduled)
+
+
+# 📬 Background Jobs: request turant 202 leti hai, workers baad mein agent chalate hain
+class ReminderJobs:
+    """
+    Bounded queue of reminder requests processed by a fixed number of
+    worker tasks on the app's event loop. Job status and results live in
+    the store's `jobs` table (up to `max_results`, oldest dropped first),
+    so `GET /reminder/{id}` works on every uvicorn worker.
+    """
+
+    PRUNE_EVERY = 1000
+
+    def __init__(self, store: ReminderStore, workers: int = 4, max_queue: int = 1000, max_results: int = 10_000):
+        self.store = store
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_results = max_results
+        self.submitted = 0
+        self._queue: asyncio.Queue | None = None
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def submit(self, work) -> str:
+        """Queue `work` (a zero-arg coroutine function); raise 503 if the queue is full."""
+        request_id = uuid.uuid4().hex
+        if self._queue.full():
+            raise HTTPException(status_code=503, detail="❌ Too many pending reminder requests, try again later")
+        # "queued" row pehle, taake worker ka "running" isko overwrite kare (ulta nahi)
+        await asyncio.to_thread(self.store.save_job, request_id, "queued")
+        try:
+            self._queue.put_nowait((request_id, work))
+        except asyncio.QueueFull:
+            await asyncio.to_thread(self.store.save_job, request_id, "failed", error="queue full")
+            raise HTTPException(status_code=503, detail="❌ Too many pending reminder requests, try again later")
+        self.submitted += 1
+        if self.submitted % self.PRUNE_EVERY == 0:
+            await asyncio.to_thread(self.store.prune_jobs, self.max_results)
+        return request_id
+
+    async def _worker(self):
+        while True:
+            request_id, work = await self._queue.get()
+            # Status SQLite mein → har write worker thread pe, event loop pe nahi
+            await asyncio.to_thread(self.store.save_job, request_id, "running")
+            try:
+                result = await work()
+            except HTTPException as e:
+                await asyncio.to_thread(self.store.save_job, request_id, "failed", error=e.detail)
+            except Exception as e:
+                await asyncio.to_thread(self.store.save_job, request_id, "failed", error=str(e))
+            else:
+                await asyncio.to_thread(self.store.save_job, request_id, "done", result=result)
+            finally:
+                self._queue.task_done()
+
+    def get(self, request_id: str) -> dict | None:
+        return self.store.get_job(request_id)
+
+
+REMINDER_ASYNC_API = os.getenv("REMINDER_ASYNC_API", "0") == "1"
+AGENT_WORKERS = int(os.getenv("AGENT_WORKERS", "4"))
+AGENT_QUEUE_SIZE = int(os.getenv("AGENT_QUEUE_SIZE", "1000"))
+
+reminder_jobs = ReminderJobs(scheduler.store, workers=AGENT_WORKERS, max_queue=AGENT_QUEUE_SIZE)
+
+
+@app.on_event("startup")
+async def start_reminder_jobs():
+    if REMINDER_ASYNC_API:
+        reminder_jobs.start()
+
+
+def accepted(request_id: str):
+    return JSONResponse(status_code=202, content={"request_id": request_id, "status": "queued"})
+
+
+# 🚀 FastAPI Endpoint
+@app.post("/reminder")
+async def create_reminder(details: ReminderInput):
+    if REMINDER_ASYNC_API:
+        return accepted(await reminder_jobs.submit(lambda: handle_reminder(details)))
+    return await handle_reminder(details)
+
+
+# 🚀 FastAPI Endpoint (free text → agent)
+@app.post("/reminder/text")
+async def create_reminder_from_text(details: ReminderText):
+    if REMINDER_ASYNC_API:
+        return accepted(await reminder_jobs.submit(lambda: run_agent(details.text, details.source)))
+    return await run_agent(details.text, details.source)
+
+
+# 🔎 Background request ka status / final output
+@app.get("/reminder/{request_id}")
+def get_reminder_status(request_id: str):
+    job = reminder_jobs.get(request_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="❌ Unknown request_id")
+    return job
+
+
+# ✏️ Reminder Update Schema (patient + medicine ke dose times replace karna)
+class ReminderUpdate(BaseModel):
+    phone: str
+    medicine_name: str
+    dose_times: list[str]
+
+
+def reminder_info(reminder: Reminder) -> dict:
+    return {
+        "id": reminder.id,
+        "phone": reminder.phone,
+        "medicine": reminder.medicine,
+        "time": reminder.t,
+        "t_24": reminder.t_24,
+        "next_fire_at": datetime.fromtimestamp(reminder.next_fire_at).isoformat(),
+    }
+
+
+# 📋 Patient / medicine ke reminders (pages mein: ek medicine ke lakhon reminders ho sakte hain)
+@app.get("/reminders")
+def list_reminders(phone: str | None = None, medicine: str | None = None, after: int = 0,
+                   limit: int = Query(100, ge=1, le=1000)):
+    if phone is None and medicine is None:
+        raise HTTPException(status_code=422, detail="❌ phone or medicine is required")
+    page = scheduler.store.find_page(phone, medicine, after, limit)
+    return {
+        "reminders": [reminder_info(r) for r in page],
+        "next": page[-1].id if len(page) == limit else None,
+    }
+
+
+# 🗑 Reminder cancel karna (time na diya to us medicine ke saare, medicine bhi na di to patient ke saare)
+@app.delete("/reminder")
+async def cancel_reminder(phone: str, medicine: str | None = None,
+                          dose_time: str | None = Query(None, alias="time")):
+    try:
+        t_24 = to_24h(dose_time) if dose_time is not None else None
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"❌ Invalid dose time: {e}")
+    cancelled = await asyncio.to_thread(scheduler.cancel_where, phone, medicine, t_24)
+    agent_cache.invalidate(phone)
+    if not cancelled:
+        raise HTTPException(status_code=404, detail="❌ No matching reminder")
+    return {"cancelled": cancelled, "status": "Reminders cancelled ✔ "}
+
+
+def replace_dose_times(phone: str, medicine: str, dose_times: list[str], new_times: set[str]) -> dict | None:
+    # Store I/O wala hissa: endpoint isse worker thread pe chalata hai
+    existing = scheduler.find(phone, medicine)
+    if not existing:
+        return None
+    removed = [r.t for r in existing if r.t_24 not in new_times]
+    for reminder in existing:
+        if reminder.t_24 not in new_times:
+            scheduler.cancel_where(phone, medicine, reminder.t_24)
+    output = add_reminders(phone, medicine, dose_times)
+    return {"response": output, "removed": removed, "status": "Reminders updated ✔ "}
+
+
+# ✏️ Medicine ke dose times badalna
+@app.patch("/reminder")
+async def update_reminder(details: ReminderUpdate):
+    try:
+        new_times = {to_24h(t) for t in details.dose_times}
+        for t_24 in new_times:
+            next_fire_at(t_24)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"❌ Invalid dose time: {e}")
+
+    updated = await asyncio.to_thread(replace_dose_times, details.phone, details.medicine_name,
+                                      details.dose_times, new_times)
+    if updated is None:
+        raise HTTPException(status_code=404, detail="❌ No matching reminder")
+    agent_cache.invalidate(details.phone)
+    return updated
+
+
+# ☠️ Dead letters: jo reminders retries ke baad bhi nahi gaye
+def dead_letter_info(row: tuple) -> dict:
+    rowid, key, phone, medicines, t, due_at, attempts, error, failed_at = row
+    return {
+        "id": rowid,
+        "key": key,
+        "phone": phone,
+        "medicines": json.loads(medicines),
+        "time": t,
+        "due_at": datetime.fromtimestamp(due_at).isoformat(),
+        "attempts": attempts,
+        "error": error,
+        "failed_at": datetime.fromtimestamp(failed_at).isoformat(),
+    }
+
+
+@app.get("/dlq")
+def list_dead_letters(after: int = 0, limit: int = Query(100, ge=1, le=1000)):
+    rows = scheduler.store.dead_letters(after, limit)
+    return {
+        "dead_letters": [dead_letter_info(row) for row in rows],
+        "next": rows[-1][0] if len(rows) == limit else None,
+        "total": scheduler.store.count_dead_letters(),
+        "replay": dlq_replay.stats(),
+    }
+
+
+# 🔁 Dead letters dobara bhejna (batches mein, DLQ_REPLAY_RATE se zyada tez nahi)
+class DeadLetterReplayRequest(BaseModel):
+    limit: int | None = None
+    batch_size: int = 100
+
+
+@app.post("/dlq/replay")
+def replay_dead_letters(details: DeadLetterReplayRequest):
+    if details.batch_size < 1 or (details.limit is not None and details.limit < 1):
+        raise HTTPException(status_code=422, detail="❌ limit and batch_size must be positive")
+    if not dlq_replay.start(details.limit, details.batch_size):
+        raise HTTPException(status_code=409, detail="❌ A dead letter replay is already running")
+    return JSONResponse(status_code=202, content={"status": "replaying", "total": scheduler.store.count_dead_letters()})
 
 
 # 🔄 Direct test run
@@ -0,0 +1,7 @@
+import os, tempfile
+
+# main.py import karne ke liye dummy config (koi network call nahi hoti)
+os.environ.setdefault("API_KEY", "test")
+os.environ.setdefault("Api_Url", "http://127.0.0.1:9/")
+os.environ.setdefault("Token", "test")
+os.environ.setdefault("REMINDER_DB", os.path.join(tempfile.mkdtemp(prefix="test-"), "reminders.db"))
@@ -0,0 +1,107 @@
+"""Agent path: admission queue priority and cancellation, result cache invalidation."""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from main import AgentAdmission, AgentResultCache
+
+KEY = ("+923001234567", "panadol", ("09:00:00",))
+
+
+def test_admission_serves_clinic_before_caregiver_before_self():
+    async def scenario():
+        admission = AgentAdmission(max_concurrency=1, max_waiting=10)
+        await admission.acquire("self")
+        order = []
+
+        async def run(name: str, source: str):
+            async with admission.slot(source):
+                order.append(name)
+
+        tasks = [asyncio.create_task(run(name, source)) for name, source in
+                 [("self-1", "self"), ("caregiver", "caregiver"), ("self-2", "unknown"), ("clinic", "clinic")]]
+        await asyncio.sleep(0)
+        assert admission.stats()["waiting"] == 4
+        admission.release()
+        await asyncio.gather(*tasks)
+        assert order == ["clinic", "caregiver", "self-1", "self-2"]
+        assert admission.active == 0
+    asyncio.run(scenario())
+
+
+def test_admission_rejects_when_the_queue_is_full():
+    async def scenario():
+        admission = AgentAdmission(max_concurrency=1, max_waiting=1)
+        await admission.acquire()
+        waiter = asyncio.create_task(admission.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as e:
+            await admission.acquire("clinic")
+        assert e.value.status_code == 503 and admission.rejected == 1
+        admission.release()
+        await waiter
+        admission.release()
+        assert admission.active == 0
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    async def scenario():
+        admission = AgentAdmission(max_concurrency=1, max_waiting=10)
+        await admission.acquire()
+        # Queue mein hi cancel: slot agle waiter ko milta hai
+        gone = asyncio.create_task(admission.acquire())
+        served = asyncio.create_task(admission.acquire())
+        await asyncio.sleep(0)
+        gone.cancel()
+        admission.release()
+        await served
+        assert gone.cancelled() and admission.active == 1
+        # Slot mil gaya magar usi waqt cancel: slot wapas, active 0
+        granted = asyncio.create_task(admission.acquire())
+        await asyncio.sleep(0)
+        admission.release()
+        granted.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await granted
+        assert admission.active == 0 and admission.stats()["waiting"] == 0
+    asyncio.run(scenario())
+
+
+def counting_run():
+    runs = 0
+
+    async def run():
+        nonlocal runs
+        runs += 1
+        await asyncio.sleep(0.01)
+        return {"response": runs}
+    return run
+
+
+def test_invalidate_drops_cached_and_in_flight_results():
+    async def scenario():
+        cache, run = AgentResultCache(max_size=10, ttl=60), counting_run()
+        assert await cache.get_or_run(KEY, run) == {"response": 1}
+        assert await cache.get_or_run(KEY, run) == {"response": 1}
+        assert cache.invalidate("+923001234567") == 1
+        assert cache.invalidate("+923001234567") == 0
+        # Invalidate ke waqt chal raha run: caller ko result milta hai, magar cache mein nahi jata
+        pending = asyncio.create_task(cache.get_or_run(KEY, run))
+        await asyncio.sleep(0)
+        cache.invalidate("+923001234567")
+        assert await pending == {"response": 2}
+        assert await cache.get_or_run(KEY, run) == {"response": 3}
+        assert cache.hits == 1 and cache.misses == 3
+    asyncio.run(scenario())
+
+
+def test_stale_cached_result_is_not_served():
+    async def scenario():
+        cache, run = AgentResultCache(max_size=10, ttl=60), counting_run()
+        await cache.get_or_run(KEY, run)
+        # Kisi aur worker ne reminder cancel kar diya → fresh() False → dobara agent
+        assert await cache.get_or_run(KEY, run, fresh=lambda key: False) == {"response": 2}
+        assert await cache.get_or_run(KEY, run, fresh=lambda key: True) == {"response": 2}
+    asyncio.run(scenario())
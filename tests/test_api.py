@@ -0,0 +1,118 @@
+"""HTTP endpoints: listing, updating and cancelling reminders; the dead-letter queue."""
+import time, zlib
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+client = TestClient(main.app)  # startup events nahi chalte: scheduler loop / leader election band
+
+
+@pytest.fixture
+def phone(request) -> str:
+    # Har test ka apna patient (sab tests ek hi REMINDER_DB share karte hain)
+    return f"+92355{zlib.crc32(request.node.name.encode()) % 10**7:07d}"
+
+
+def schedule(phone: str, medicine: str, times: list[str]):
+    res = client.post("/reminder", json={"medicine_name": medicine, "dose_times": times, "phone": phone})
+    assert res.status_code == 200, res.text
+
+
+def times_for(phone: str) -> dict[str, list[str]]:
+    reminders = client.get("/reminders", params={"phone": phone}).json()["reminders"]
+    medicines: dict[str, list[str]] = {}
+    for reminder in reminders:
+        medicines.setdefault(reminder["medicine"], []).append(reminder["t_24"])
+    return {medicine: sorted(times) for medicine, times in medicines.items()}
+
+
+def test_patch_replaces_dose_times_and_invalidates_cache(phone):
+    schedule(phone, "Panadol", ["9:00 AM", "21:00"])
+    main.agent_cache.put((phone, "panadol", ("09:00:00", "21:00:00")), {"response": "cached"})
+
+    update = {"phone": phone, "medicine_name": "Panadol", "dose_times": ["10:00", "9:00 AM"]}
+    res = client.patch("/reminder", json=update)
+    assert res.status_code == 200
+    assert res.json()["removed"] == ["21:00"]
+    assert times_for(phone) == {"Panadol": ["09:00:00", "10:00:00"]}
+    assert main.agent_cache.get((phone, "panadol", ("09:00:00", "21:00:00"))) is None
+
+    missing = {"phone": phone, "medicine_name": "Brufen", "dose_times": ["10:00"]}
+    assert client.patch("/reminder", json=missing).status_code == 404
+    bad = {"phone": phone, "medicine_name": "Panadol", "dose_times": ["25:00"]}
+    assert client.patch("/reminder", json=bad).status_code == 422
+    assert times_for(phone) == {"Panadol": ["09:00:00", "10:00:00"]}
+
+
+def test_delete_cancels_one_time_one_medicine_or_everything(phone):
+    schedule(phone, "Panadol", ["9:00 AM", "21:00"])
+    schedule(phone, "Brufen", ["8:00 AM"])
+    main.agent_cache.put((phone, "brufen", ("08:00:00",)), {"response": "cached"})
+
+    res = client.delete("/reminder", params={"phone": phone, "medicine": "Panadol", "time": "9:00 am"})
+    assert res.json()["cancelled"] == 1
+    assert times_for(phone) == {"Panadol": ["21:00:00"], "Brufen": ["08:00:00"]}
+    assert main.agent_cache.get((phone, "brufen", ("08:00:00",))) is None
+    assert client.delete("/reminder", params={"phone": phone, "medicine": "Brufen"}).json()["cancelled"] == 1
+    assert client.delete("/reminder", params={"phone": phone}).json()["cancelled"] == 1
+    assert times_for(phone) == {}
+    assert client.delete("/reminder", params={"phone": phone}).status_code == 404
+    assert client.delete("/reminder", params={"phone": phone, "time": "noon"}).status_code == 422
+
+
+def test_list_reminders_pages_by_id(phone):
+    schedule(phone, "Panadol", ["6:00", "7:00", "8:00", "9:00", "10:00"])
+    assert client.get("/reminders").status_code == 422
+    seen, after = [], 0
+    while after is not None:
+        page = client.get("/reminders", params={"phone": phone, "after": after, "limit": 2}).json()
+        assert len(page["reminders"]) <= 2
+        seen += [r["id"] for r in page["reminders"]]
+        after = page["next"]
+    assert len(seen) == 5 and seen == sorted(seen)
+
+
+class CapturingDispatcher:
+    def __init__(self):
+        self.jobs = []
+
+    def start(self):
+        pass
+
+    def submit(self, job):
+        self.jobs.append(job)
+
+
+def test_dlq_lists_pages_and_replays(monkeypatch, phone):
+    store = main.scheduler.store
+    jobs = main.outbox.record_many([[main.Reminder(phone=phone, medicine=f"Med{i}", t="9:00 AM", t_24="09:00:00",
+                                                   next_fire_at=time.time() - 60 * i)] for i in range(3)])
+    for job in jobs:
+        store.settle(job.key, "failed", 5, "❌ Error: 503")
+    keys = {job.key for job in jobs}
+
+    listed, after = [], 0
+    while after is not None:
+        page = client.get("/dlq", params={"after": after, "limit": 2}).json()
+        listed += [row for row in page["dead_letters"] if row["key"] in keys]
+        after = page["next"]
+    assert {row["key"] for row in listed} == keys
+    assert all(row["phone"] == phone and row["attempts"] == 5 and row["error"] == "❌ Error: 503" for row in listed)
+    assert page["total"] >= 3
+
+    assert client.post("/dlq/replay", json={"batch_size": 0}).status_code == 422
+    monkeypatch.setattr(main.dlq_replay, "running", True)
+    assert client.post("/dlq/replay", json={}).status_code == 409
+    monkeypatch.setattr(main.dlq_replay, "running", False)
+
+    dispatcher = CapturingDispatcher()
+    monkeypatch.setattr(main, "dispatcher", dispatcher)
+    assert client.post("/dlq/replay", json={"batch_size": 2}).status_code == 202
+    deadline = time.time() + 5
+    while main.dlq_replay.running and time.time() < deadline:
+        time.sleep(0.05)
+    assert keys <= {job.key for job in dispatcher.jobs}
+    # Replay ke liye claim hue → pending, DLQ mein nahi
+    assert not [row for row in client.get("/dlq", params={"limit": 1000}).json()["dead_letters"] if row["key"] in keys]
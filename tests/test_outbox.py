@@ -0,0 +1,25 @@
+"""Outbox: a due message is journaled once, however often its reminders fire."""
+from main import Outbox, Reminder, ReminderStore
+
+NOW = 1_700_000_000.0
+
+
+def reminder(i: int, fire_at: float, phone: str, medicine: str = "Panadol") -> Reminder:
+    return Reminder(phone=phone, medicine=medicine, t="9:00 AM", t_24="09:00:00", next_fire_at=fire_at, id=i)
+
+
+def test_outbox_record_suppresses_duplicates(tmp_path):
+    outbox = Outbox(ReminderStore(str(tmp_path / "outbox.db")), deadline=900)
+    batch = [reminder(1, NOW, phone="+923001234567"), reminder(2, NOW, phone="+923001234567", medicine="Brufen")]
+
+    job = outbox.record(batch)
+    assert job is not None and job.key == Outbox.key_for(batch)
+    assert job.deadline == NOW + 900
+    # Crash ke baad wahi dose dobara fire ho (medicines ki order alag bhi ho) → koi naya message nahi
+    assert outbox.record(list(reversed(batch))) is None
+    other = [reminder(3, NOW + 60, phone="+923001234567")]
+    jobs = outbox.record_many([batch, other, other])
+    assert [j.key for j in jobs] == [Outbox.key_for(other)]
+    assert outbox.stats()["journaled"] == 2
+    assert outbox.stats()["duplicates"] == 3
+    assert [row[0] for row in outbox.store.unsent()] == [job.key, Outbox.key_for(other)]
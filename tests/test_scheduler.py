@@ -0,0 +1,132 @@
+"""
+Scheduler tests: timing wheel vs heap, same-minute coalescing, loop recovery, string table, lease health.
+
+Usage:
+    pip install pytest
+    python -m pytest
+"""
+import random, sqlite3, time
+from datetime import datetime
+
+import pytest
+from main import HeapBackend, LeaderElection, Reminder, ReminderScheduler, ReminderStore, TimingWheelBackend
+
+NOW = 1_700_000_000.0
+
+
+def reminder(i: int, fire_at: float, phone: str | None = None, medicine: str = "Panadol") -> Reminder:
+    return Reminder(phone=phone or f"+92300{i:07d}", medicine=medicine, t="9:00 AM", t_24="09:00:00",
+                    next_fire_at=fire_at, id=i)
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_timing_wheel_matches_heap(seed):
+    rnd = random.Random(seed)
+    heap, wheel = HeapBackend(), TimingWheelBackend(NOW)
+    reminders = []
+    for i in range(2000):
+        # Seconds, minutes, hours aur overflow (1 din se door) sab wheels ko chhuye
+        delay = rnd.choice((rnd.uniform(0, 60), rnd.uniform(0, 3600), rnd.uniform(0, 86400),
+                            rnd.uniform(86400, 3 * 86400)))
+        # Aadhe integer seconds pe, aadhe fraction pe (wheel ceil karta hai, heap exact)
+        r = reminder(i, NOW + (int(delay) if i % 2 else delay))
+        reminders.append(r)
+        heap.push(r)
+        wheel.push(r)
+    for r in rnd.sample(reminders, 200):
+        r.cancelled = True
+        heap.discard(r)
+        wheel.discard(r)
+
+    now, end = NOW, NOW + 3 * 86400 + 2
+    fired = set()
+    while now < end:
+        # Pehle second-by-second, phir bade jumps (idle gaps ke baad catch-up)
+        now += 1 if now < NOW + 300 else rnd.randint(1, 5000)
+        from_heap = {r.id for r in heap.pop_due(now) if not r.cancelled}
+        from_wheel = {r.id for r in wheel.pop_due(now) if not r.cancelled}
+        assert from_heap == from_wheel, f"mismatch at +{now - NOW:.0f}s"
+        assert not fired & from_heap
+        fired |= from_heap
+    assert fired == {r.id for r in reminders if not r.cancelled}
+    assert wheel.next_deadline() is None
+
+
+def test_same_minute_doses_go_out_together_once():
+    scheduler = ReminderScheduler(HeapBackend())
+    generation = scheduler._begin()
+    minute = NOW - NOW % 60
+    patient = "+923001111111"
+    scheduler.add(reminder(1, minute, phone=patient))
+    scheduler.add(reminder(2, minute + 30, phone=patient, medicine="Brufen"))
+    scheduler.add(reminder(3, minute + 65, phone=patient, medicine="Augmentin"))  # agla minute
+    scheduler.add(reminder(4, minute + 10, phone="+923002222222"))
+    scheduler.add(reminder(5, minute + 20, phone="+923003333333"))
+    scheduler.cancel_where("+923003333333")
+
+    sent = []
+    fired = lambda: [sorted(r.id for r in batch) for batch in sent]
+    scheduler._fire_due(minute + 1, sent.extend, generation)
+    assert fired() == [[1, 2]]
+    # 2 ki purani heap entry (minute + 30) abhi bhi pari hai, magar wo ab kal ka hai → skip
+    scheduler._fire_due(minute + 59, sent.extend, generation)
+    assert fired() == [[1, 2], [4]]
+    scheduler._fire_due(minute + 70, sent.extend, generation)
+    assert fired() == [[1, 2], [4], [3]]
+    assert scheduler.fired == 4 and scheduler.messages == 3
+    assert all(r.next_fire_at > minute + 3600 for r in scheduler._by_key.values())
+
+
+def test_failed_fire_puts_reminders_back():
+    scheduler = ReminderScheduler(HeapBackend())
+    generation = scheduler._begin()
+    scheduler.add(reminder(1, NOW))
+    scheduler.add(reminder(2, NOW + 30, phone="+923000000001", medicine="Brufen"))
+
+    def broken(batches):
+        raise sqlite3.OperationalError("database is locked")
+    with pytest.raises(sqlite3.OperationalError):
+        scheduler._fire_due(NOW + 1, broken, generation)
+    assert scheduler.fired == 0
+
+    sent = []
+    scheduler._fire_due(NOW + 1, sent.extend, generation)
+    # Dono (same-minute wala bhi) ek hi dafa, ek message mein
+    assert [sorted(r.id for r in batch) for batch in sent] == [[1, 2]]
+    assert scheduler._fire_due(NOW + 60, sent.extend, generation) is None and len(sent) == 1
+
+
+def test_strings_leave_with_their_reminders(tmp_path):
+    scheduler = ReminderScheduler(HeapBackend(), store=ReminderStore(str(tmp_path / "strings.db")), horizon=3600)
+    generation = scheduler._begin()
+    now = time.time()
+    # Dose time 2 ghante pehle ka → fire ke baad agla slot ~22h baad, window se bahar
+    t_24 = datetime.fromtimestamp(now - 7200).strftime("%H:%M:%S")
+    for i in range(20):
+        scheduler.add(Reminder(phone=f"+92300{i % 5:07d}", medicine=f"Med{i}", t=t_24, t_24=t_24,
+                               next_fire_at=now + i))
+    scheduler.page_in(now)
+    assert len(scheduler) == 20 and len(scheduler._strings) == 5 + 20 + 1
+    scheduler.cancel_where("+923000000000")
+    assert len(scheduler._strings) == 4 + 16 + 1
+    scheduler._fire_due(now + 60, lambda batches: None, generation)
+    assert scheduler._strings == {} and scheduler._refs == {}
+
+
+def test_stalled_loop_gives_up_lease(tmp_path):
+    scheduler = ReminderScheduler(HeapBackend())
+    assert scheduler.alive()
+    scheduler._begin()
+    assert scheduler.alive()
+    scheduler._heartbeat -= scheduler.STALL_AFTER + 1
+    assert not scheduler.alive()
+
+    events = []
+    election = LeaderElection(ReminderStore(str(tmp_path / "lease.db")), on_elected=lambda: events.append("elected"),
+                              on_demoted=lambda: events.append("demoted"), ttl=0.3, healthy=scheduler.alive)
+    election.start()
+    deadline = time.time() + 5
+    while "demoted" not in events and time.time() < deadline:
+        time.sleep(0.05)
+    election.stop()
+    assert events[:2] == ["elected", "demoted"]
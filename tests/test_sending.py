@@ -0,0 +1,67 @@
+"""Sending: per-phone rate limiting, circuit breaker and instance ejection."""
+import time
+
+import pytest
+
+import main
+from main import CircuitBreaker, InstancePool, Reminder, SendJob, SendRateLimiter
+
+
+def reminder(i: int, phone: str) -> Reminder:
+    return Reminder(phone=phone, medicine="Panadol", t="9:00 AM", t_24="09:00:00", next_fire_at=time.time(), id=i)
+
+
+def test_phone_over_budget_waits_without_taking_a_token():
+    limiter = SendRateLimiter(rate=100, burst=100, phone_rate=1, phone_burst=2)
+    assert limiter.phone_delay("+923001234567") == 0 and limiter.phone_delay("+923001234567") == 0
+    wait = limiter.phone_delay("+923001234567")
+    assert 0 < wait <= 1
+    # Wait batane se token nahi gaya: dobara poochne pe wahi (thoda kam) wait, zyada nahi
+    assert limiter.phone_delay("+923001234567") <= wait
+    assert limiter.phone_delay("+923007654321") == 0
+
+
+def test_circuit_breaker_opens_then_probes_once():
+    breaker = CircuitBreaker(failures=3, reset_timeout=0.1)
+    for _ in range(2):
+        breaker.record(False)
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record(False)
+    assert breaker.state == "open" and not breaker.allow()
+    time.sleep(0.1)
+    assert breaker.state == "half_open"
+    assert breaker.allow() and not breaker.allow()  # sirf ek probe
+    breaker.record(False)
+    assert breaker.state == "open" and breaker.opens == 1
+    time.sleep(0.1)
+    assert breaker.allow()
+    breaker.record(True)
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_failing_instance_is_ejected():
+    pool = InstancePool([("http://a/", "ta"), ("http://b/", "tb")], min_samples=4, eject_seconds=60)
+    a, b = pool.instances
+    assert pool.pick("+923000000001") is a
+    pool.release(a, False)
+    for ok in (True, False, False):
+        pool.release(pool.pick("+923000000001"), ok)
+    assert a.ejected_until > time.monotonic()
+    # Sticky phone bhi healthy instance pe chala jata hai
+    assert pool.pick("+923000000001") is b
+
+
+@pytest.mark.parametrize("code, unhealthy", [(400, False), (404, False), (429, True), (503, True), (None, True)])
+def test_only_retryable_failures_count_against_an_instance(monkeypatch, code, unhealthy):
+    pool = InstancePool([("http://a/", "ta")], min_samples=2, breaker_failures=2)
+    monkeypatch.setattr(main, "instance_pool", pool)
+    monkeypatch.setattr(main, "rate_limiter", SendRateLimiter(rate=1000, burst=1000, phone_rate=1000, phone_burst=1000))
+    monkeypatch.setattr(main, "post_whatsapp", lambda *args, **kwargs: {"status": f"❌ Error: {code}", "code": code})
+    monkeypatch.setattr(main.retry_queue, "max_attempts", 1)
+    for i in range(3):
+        job = SendJob([reminder(i, f"+92311{i:07d}")], deadline=time.time() + 60, term=main.outbox.term)
+        main.deliver(job)
+    instance = pool.instances[0]
+    assert (instance.breaker.state == "open") is unhealthy
+    assert (instance.errors > 0) is unhealthy
+    assert instance.outstanding == 0
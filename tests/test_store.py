@@ -0,0 +1,31 @@
+"""Reminder store: moving reminders and outbox rows when the shard count changes."""
+import sqlite3
+
+from main import Outbox, Reminder, ReminderStore, phone_hash
+
+NOW = 1_700_000_000.0
+
+
+def reminder(i: int, fire_at: float, phone: str) -> Reminder:
+    return Reminder(phone=phone, medicine="Panadol", t="9:00 AM", t_24="09:00:00", next_fire_at=fire_at, id=i)
+
+
+def test_rebalance_moves_reminders_and_outbox(tmp_path):
+    path = str(tmp_path / "shards.db")
+    store = ReminderStore(path, shards=1)
+    phones = [f"+92300{i:07d}" for i in range(50)]
+    for i, phone in enumerate(phones):
+        assert store.add(Reminder(phone=phone, medicine="Panadol", t="9:00 AM", t_24="09:00:00",
+                                  next_fire_at=NOW + i))
+    Outbox(store, deadline=900).record_many([[reminder(i, NOW + i, phone=phone)] for i, phone in enumerate(phones)])
+    store.publish("add", phones[0], reminder_id=1)
+
+    resharded = ReminderStore(path, shards=4)
+    resharded.rebalance()
+    db = sqlite3.connect(path)
+    assert dict(db.execute("SELECT phone, shard FROM reminders")) == {p: phone_hash(p) % 4 for p in phones}
+    assert dict(db.execute("SELECT phone, shard FROM outbox")) == {p: phone_hash(p) % 4 for p in phones}
+    assert db.execute("SELECT COUNT(*) FROM reminder_events").fetchone()[0] == 0
+    assert sorted(len(resharded.unsent(shard)) for shard in range(4)) != [0, 0, 0, 50]
+    assert sum(len(resharded.unsent(shard)) for shard in range(4)) == 50
+    assert db.execute("SELECT value FROM meta WHERE key = 'shards'").fetchone()[0] == "4"
@@ -0,0 +1,18 @@
+"""Dose time parsing: every accepted form normalizes to "HH:MM:SS", anything else is rejected."""
+import pytest
+
+from main import to_24h
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("9:00 AM", "09:00:00"), ("09:00", "09:00:00"), ("9:00", "09:00:00"), (" 09:00:00 ", "09:00:00"),
+    ("9 pm", "21:00:00"), ("21:05", "21:05:00"),
+])
+def test_to_24h_normalizes(text, expected):
+    assert to_24h(text) == expected
+
+
+@pytest.mark.parametrize("text", ["25:00", "9", "noon", ""])
+def test_to_24h_rejects_garbage(text):
+    with pytest.raises(ValueError):
+        to_24h(text)